@@ -0,0 +1,232 @@
+"""
+Analytic fund-return distribution engine.
+
+A fund's raw return is the mean of portfolio_size i.i.d. company outcomes,
+each 0, liquidation_pct or a power-law multiple >= 1 (see pareto.py). Instead
+of sampling funds, this engine computes the distribution of the sum directly:
+the company distribution is discretized on a grid of step h and convolved
+with itself portfolio_size times by raising its (exponentially tilted) FFT to
+that power. The step is shrunk slightly so the liquidation atom falls exactly
+on a grid point when the grid can afford it; otherwise the atom is split
+between its two neighbouring points.
+
+All outcomes are non-negative, so the sum can only land on [0, x] if every
+company does. Mass beyond the end of the grid is therefore dropped rather
+than wrapped around, and the CDF on the grid is exact up to the
+discretization, however heavy the tail. That matters because alpha is
+usually below 3 (infinite variance, often infinite mean), where normal and
+saddlepoint approximations break down. The grid is sized with the
+single-big-jump tail, P(sum > x) ~ portfolio_size * p_multiple *
+x^(1 - alpha), which holds for every alpha, and doubled until it covers the
+requested quantiles.
+
+The grid has at most MAX_GRID_POINTS points, so the engine raises a
+ValueError when the tail is too heavy (alpha close to 1) to cover the
+requested quantiles at a fund-return resolution of MAX_STEP; use the Monte
+Carlo engine there. Otherwise the result does not depend on simulation_runs
+and takes milliseconds for the default parameters, up to a few hundred for the
+heaviest tails.
+"""
+
+import numpy as np
+
+from batch import PROB_DIST_COLUMNS, QUANTILES
+from fees import net_fund_multiples
+from instrumentation import timed
+from library import (FUND_BUCKET_EDGES, FUND_BUCKETS, calculate_alpha, convert_moic_to_cagr,
+                     normalize_prob_dist, simulate_fund_returns)
+from pareto import power_law_cdf
+
+# Default number of grid points for the sum of the company outcomes
+DEFAULT_GRID_POINTS = 2**17
+
+# Hard cap on the grid points (the FFT works on twice as many)
+MAX_GRID_POINTS = 2**20
+
+# Coarsest acceptable grid step, as a fund return multiple
+MAX_STEP = 0.05
+
+# Relative tolerance when comparing returns against grid values
+ROUND_OFF = 1e-12
+
+# Exponential tilt across the grid that suppresses FFT wrap-around; keeps both
+# the aliased mass (~e^-36) and the amplified round-off (~1e-8) negligible
+TILT = 18.0
+
+
+class FundReturnDistribution:
+    """Discrete distribution of fund return multiples on a grid.
+
+    Args:
+        values: non-decreasing return multiples, one per grid point
+        pmf: probability of each grid point; sums to 1 - tail_mass
+        tail_mass: probability of a return beyond the last grid point
+    """
+
+    def __init__(self, values, pmf, tail_mass=0.0):
+        self.values = values
+        self.pmf = pmf
+        self.tail_mass = tail_mass
+
+    @property
+    def cdf_values(self):
+        return np.cumsum(self.pmf)
+
+    def cdf(self, x):
+        """P(return <= x) for every x."""
+        # Allow for round-off, so returns landing on a grid point (such as
+        # funds without a "MULTIPLE" company) count their atom
+        indices = np.searchsorted(self.values, np.asarray(x) * (1 + ROUND_OFF), side="right")
+        cdf = np.concatenate([[0.0], self.cdf_values])
+        return cdf[indices]
+
+    def quantiles(self, qs):
+        """Smallest return whose CDF reaches each q; inf beyond the grid."""
+        indices = np.searchsorted(self.cdf_values, np.asarray(qs, dtype=np.float64), side="left")
+        padded = np.concatenate([self.values, [np.inf]])
+        return padded[np.minimum(indices, len(self.values))]
+
+    def bucket_probabilities(self):
+        """Probability of each bucket in FUND_BUCKETS, using the same edges as
+        library.fund_bucket_indices."""
+        below_edges = [self.pmf[self.values < edge * (1 - ROUND_OFF)].sum() for edge in FUND_BUCKET_EDGES]
+        return np.diff(np.concatenate([[0.0], below_edges, [1.0]]))
+
+    def net(self, mgmt_pct_fee, fund_lifespan, carry_pct=0.0, hurdle_rate=0.0, catch_up_pct=1.0):
+        """The distribution of the LPs' net multiples. The fee waterfall is
+        non-decreasing in the raw return, so only the grid values change."""
+        return FundReturnDistribution(net_fund_multiples(self.values, mgmt_pct_fee, fund_lifespan,
+                                                         carry_pct, hurdle_rate, catch_up_pct),
+                                      self.pmf, self.tail_mass)
+
+
+# FUNC: Discretizes a single company's outcome on points grid points of width
+# step. Power-law mass is assigned to the nearest grid point; mass beyond the
+# grid is dropped. The liquidation atom is split linearly between its two
+# neighbouring grid points, which keeps its mean, unless it sits on one
+def company_pmf(prob_dist, liquidation_pct, alpha, step, points):
+    p_zero, p_liquidation, p_multiple = normalize_prob_dist(prob_dist)
+    edges = (np.arange(points + 1) - 0.5) * step
+    pmf = p_multiple * np.diff(power_law_cdf(edges, alpha))
+    pmf[0] += p_zero
+
+    position = liquidation_pct / step
+    lower = int(np.floor(position * (1 + ROUND_OFF)))
+    weight = max(position - lower, 0.0)
+    pmf[lower] += p_liquidation * (1 - weight)
+    if weight > ROUND_OFF:
+        pmf[lower + 1] += p_liquidation * weight
+    return pmf
+
+
+# FUNC: Raises a distribution on the grid to the n-fold convolution power with
+# one FFT pair, truncated to the grid. The pmf is exponentially tilted first,
+# which damps the mass that would wrap around from beyond the grid by
+# exp(-2 * TILT); untilting amplifies the FFT round-off by at most exp(TILT)
+def convolution_power(pmf, n):
+    points = len(pmf)
+    size = 1 << (2 * points - 1).bit_length()
+    tilt = np.exp(-TILT / points * np.arange(points))
+    power = np.fft.irfft(np.fft.rfft(pmf * tilt, size) ** n, size)[:points] / tilt
+    return np.maximum(power, 0.0)
+
+
+# FUNC: Computes the distribution of raw fund returns, covering at least the
+# max_quantile quantile, on a grid of about grid_points points
+@timed("analytic.fund_return_distribution")
+def fund_return_distribution(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, max_quantile=0.99, grid_points=DEFAULT_GRID_POINTS):
+    alpha = calculate_alpha(average_yoy_growth, average_exit_time)
+    portfolio_size = int(portfolio_size)
+    _, p_liquidation, p_multiple = normalize_prob_dist(prob_dist)
+
+    # Cover the body (twice the sum of the typical outcomes) and the tail up
+    # to a quarter of the mass left above max_quantile. Both overflow to inf
+    # as alpha approaches 1
+    tail_mass = (1.0 - max_quantile) / 4
+    with np.errstate(over="ignore"):
+        typical = p_liquidation * liquidation_pct + p_multiple * np.float64(2.0) ** (1 / (alpha - 1))
+        big_jump = (portfolio_size * p_multiple / tail_mass) ** (1 / (alpha - 1))
+    span = max(2 * portfolio_size * typical, big_jump, 2 * portfolio_size)
+
+    while True:
+        # Use more than grid_points points if the step would otherwise be
+        # coarser than MAX_STEP, but never more than MAX_GRID_POINTS
+        points = min(max(grid_points, np.ceil(span / (MAX_STEP * portfolio_size))), MAX_GRID_POINTS)
+        step = span / points
+        if not np.isfinite(step) or step > MAX_STEP * portfolio_size:
+            raise ValueError("alpha = {:.3f} is too heavy-tailed for the analytic engine: covering "
+                             "the {:g} quantile needs a grid step above {:g}x; use the Monte Carlo "
+                             "engine".format(alpha, max_quantile, MAX_STEP))
+        # Shrink the step so the liquidation outcome sits on a grid point, as
+        # long as the grid stays within MAX_GRID_POINTS
+        if liquidation_pct > 0:
+            snapped = liquidation_pct / np.ceil(liquidation_pct / step)
+            if span / snapped < MAX_GRID_POINTS:
+                step = snapped
+        points = int(np.ceil(span / step)) + 1
+
+        pmf = convolution_power(company_pmf(prob_dist, liquidation_pct, alpha, step, points),
+                                portfolio_size)
+        covered = pmf.sum()
+        if covered >= max_quantile + tail_mass:
+            break
+        span *= 2
+
+    values = np.arange(points) * step / portfolio_size
+    return FundReturnDistribution(values, pmf, max(1.0 - covered, 0.0))
+
+
+# FUNC: Builds a batch summary row (see batch.summarize_scenario) from the
+# analytic distribution of a scenario's net returns. The mean is dominated by
+# the tail beyond the grid, and infinite for alpha <= 2, so it is left as NaN
+def summarize_distribution(scenario, distribution):
+    summary = {key: value for key, value in scenario.items() if key != "prob_dist"}
+    summary.update(zip(PROB_DIST_COLUMNS, scenario["prob_dist"]))
+    summary["alpha"] = calculate_alpha(scenario["average_yoy_growth"], scenario["average_exit_time"])
+    summary["mean_moic"] = np.nan
+    for q, value in zip(QUANTILES, distribution.quantiles(QUANTILES)):
+        summary["moic_p{:.0f}".format(100 * q)] = value
+        summary["cagr_p{:.0f}".format(100 * q)] = convert_moic_to_cagr(value, scenario["fund_lifespan"])
+    for bucket, probability in zip(FUND_BUCKETS, distribution.bucket_probabilities()):
+        summary["pct_funds_" + bucket] = probability
+    summary["pct_beat_stock_market"] = 1.0 - distribution.cdf(1.10 ** scenario["fund_lifespan"])
+    return summary
+
+
+# FUNC: Simulates one scenario analytically, returning its summary row and the
+# net return distribution
+def run_scenario_analytic(scenario, grid_points=DEFAULT_GRID_POINTS):
+    distribution = fund_return_distribution(scenario["prob_dist"], scenario["liquidation_pct"],
+                                            scenario["average_yoy_growth"],
+                                            scenario["average_exit_time"],
+                                            scenario["portfolio_size"], max(QUANTILES),
+                                            grid_points)
+    distribution = distribution.net(scenario["mgmt_pct_fee"], scenario["fund_lifespan"],
+                                    scenario["carry_pct"], scenario["hurdle_rate"],
+                                    scenario["catch_up_pct"])
+    return summarize_distribution(scenario, distribution), distribution
+
+
+# FUNC: Cross-checks the analytic raw-return distribution against a Monte Carlo
+# run: the largest CDF gap on the sampled returns (a KS statistic against the
+# analytic CDF) and the largest relative error of the quantiles
+def cross_check_monte_carlo(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=200000, quantiles=QUANTILES, seed=None):
+    distribution = fund_return_distribution(prob_dist, liquidation_pct, average_yoy_growth,
+                                            average_exit_time, portfolio_size, max(quantiles))
+    raw_returns = np.sort(simulate_fund_returns(prob_dist, liquidation_pct, average_yoy_growth,
+                                                average_exit_time, portfolio_size,
+                                                simulation_runs, seed))
+
+    # Compare on the grid only; beyond it the analytic CDF is short by tail_mass
+    on_grid = raw_returns[raw_returns <= distribution.values[-1]]
+    analytic_cdf = distribution.cdf(on_grid)
+    empirical_cdf = np.searchsorted(raw_returns, on_grid, side="right") / len(raw_returns)
+    analytic_quantiles = distribution.quantiles(quantiles)
+    monte_carlo_quantiles = np.quantile(raw_returns, quantiles)
+    return {"portfolio_size": int(portfolio_size), "simulation_runs": int(simulation_runs),
+            "ks_statistic": float(np.max(np.abs(analytic_cdf - empirical_cdf))),
+            "quantiles": list(quantiles),
+            "analytic_quantiles": analytic_quantiles.tolist(),
+            "monte_carlo_quantiles": monte_carlo_quantiles.tolist(),
+            "max_relative_error": float(np.max(np.abs(analytic_quantiles - monte_carlo_quantiles)
+                                                / np.maximum(monte_carlo_quantiles, ROUND_OFF)))}
@@ -1,6 +1,6 @@
 import streamlit as st
 from multipage import MultiPage
-from pages import simulator, growth_rates
+from charts import preload_theme
 
 # Configure Streamlit page
 st.set_page_config(
@@ -15,12 +15,16 @@ st.set_page_config(
      }
  )
 
+# Load matplotlib and the fonts in the background while the page computes
+preload_theme()
+
 # Create an instance of the app
 app = MultiPage()
 
-# Add all your applications (pages) here
-app.add_page("Simulator", simulator.app)
-app.add_page("Growth Rates Calculator", growth_rates.app)
+# Add all your applications (pages) here; each page module is imported only
+# once it is selected
+app.add_page("Simulator", "pages.simulator")
+app.add_page("Growth Rates Calculator", "pages.growth_rates")
 
 # The main app
 app.run()
@@ -0,0 +1,200 @@
+"""
+Headless batch simulation API.
+
+Runs parameter sets (scenarios) through the simulation engine without
+Streamlit, and writes one summary row per scenario to Parquet, CSV or NPZ.
+Scenario parameters use the same units as library.py, i.e. fractions rather
+than the percentages shown in the app:
+
+    {"name": "base", "prob_dist": [0.33, 0.33, 0.33], "liquidation_pct": 0.8,
+     "average_yoy_growth": 0.25, "average_exit_time": 5, "portfolio_size": 50,
+     "simulation_runs": 2500, "mgmt_pct_fee": 0.02, "fund_lifespan": 10,
+     "carry_pct": 0.2, "hurdle_rate": 0.0, "catch_up_pct": 1.0}
+
+With "engine": "analytic" the quantiles and bucket shares are computed from
+the exact return distribution (see analytic.py) instead of simulated funds.
+"""
+
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import instrumentation
+from library import (DEFAULT_CHUNK_SIZE, FUND_BUCKETS, as_seed_sequence,
+                     calculate_actual_fund_returns, calculate_alpha,
+                     convert_moic_to_cagr, fund_bucket_indices,
+                     simulate_fund_returns)
+from quantiles import compute_quantiles
+
+QUANTILES = (0.25, 0.50, 0.75, 0.90, 0.99)
+
+# Values used for any parameter a scenario leaves out; they match the defaults
+# of the Simulator page
+DEFAULT_SCENARIO = {
+    "prob_dist": [0.33, 0.33, 0.33],
+    "liquidation_pct": 0.8,
+    "average_yoy_growth": 0.25,
+    "average_exit_time": 5,
+    "portfolio_size": 50,
+    "simulation_runs": 2500,
+    "mgmt_pct_fee": 0.02,
+    "fund_lifespan": 10,
+    "carry_pct": 0.2,
+    "hurdle_rate": 0.0,
+    "catch_up_pct": 1.0,
+    "sampling": "random",
+    "engine": "monte_carlo",
+}
+
+# Ways of computing a scenario: "monte_carlo" simulates simulation_runs funds,
+# "analytic" computes the return distribution directly (see analytic.py)
+ENGINES = ["monte_carlo", "analytic"]
+
+# Flat column names accepted in place of prob_dist, e.g. in CSV files
+PROB_DIST_COLUMNS = ["prob_zero", "prob_liquidation", "prob_multiple"]
+
+
+# FUNC: Reads a list of scenarios from a .json, .yaml/.yml or .csv file
+def load_scenarios(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        import pandas as pd
+        scenarios = pd.read_csv(path).to_dict("records")
+    elif extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError as error:
+            raise ImportError("Reading YAML scenarios requires PyYAML (pip install pyyaml)") from error
+        with open(path) as f:
+            scenarios = yaml.safe_load(f)
+    elif extension == ".json":
+        with open(path) as f:
+            scenarios = json.load(f)
+    else:
+        raise ValueError("Unsupported scenario file type: {}".format(extension))
+
+    if isinstance(scenarios, dict):
+        scenarios = scenarios.get("scenarios", [scenarios])
+    return [normalize_scenario(scenario, i) for i, scenario in enumerate(scenarios)]
+
+
+# FUNC: Fills in defaults and folds prob_zero/prob_liquidation/prob_multiple
+# columns into prob_dist
+def normalize_scenario(scenario, index=0):
+    scenario = {key: value for key, value in scenario.items()
+                if not (isinstance(value, float) and np.isnan(value))}
+    if all(column in scenario for column in PROB_DIST_COLUMNS):
+        scenario["prob_dist"] = [float(scenario.pop(column)) for column in PROB_DIST_COLUMNS]
+
+    unknown = set(scenario) - set(DEFAULT_SCENARIO) - {"name", "seed"}
+    if unknown:
+        raise ValueError("Unknown scenario parameters: {}".format(", ".join(sorted(unknown))))
+
+    normalized = {"name": "scenario_{}".format(index), **DEFAULT_SCENARIO}
+    normalized.update(scenario)
+    normalized["portfolio_size"] = int(normalized["portfolio_size"])
+    normalized["simulation_runs"] = int(normalized["simulation_runs"])
+    if "seed" in normalized:
+        # CSV columns with an empty cell are read as floats
+        normalized["seed"] = int(normalized["seed"])
+    if normalized["engine"] not in ENGINES:
+        raise ValueError("Unknown engine {!r}, expected one of {}".format(
+            normalized["engine"], ", ".join(ENGINES)))
+    return normalized
+
+
+# FUNC: Simulates one scenario, returning its summary row and the actual
+# (after fee) return multiple of every fund (none for the analytic engine).
+# Scenarios too heavy-tailed for the analytic engine fall back to Monte Carlo
+def run_scenario(scenario, seed=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    if scenario["engine"] == "analytic":
+        from analytic import run_scenario_analytic
+        try:
+            summary, _ = run_scenario_analytic(scenario)
+            return summary, np.empty(0, dtype=np.float64)
+        except ValueError as error:
+            warnings.warn("{}: {}; falling back to Monte Carlo".format(scenario["name"], error),
+                          RuntimeWarning)
+            scenario = {**scenario, "engine": "monte_carlo"}
+
+    seed = scenario.get("seed", seed)
+    raw_returns = simulate_fund_returns(scenario["prob_dist"], scenario["liquidation_pct"],
+                                        scenario["average_yoy_growth"],
+                                        scenario["average_exit_time"],
+                                        scenario["portfolio_size"],
+                                        scenario["simulation_runs"], seed, chunk_size,
+                                        sampling=scenario["sampling"])
+    actual_returns = calculate_actual_fund_returns(raw_returns, scenario["mgmt_pct_fee"],
+                                                   scenario["fund_lifespan"], scenario["carry_pct"],
+                                                   scenario["hurdle_rate"], scenario["catch_up_pct"])
+    return summarize_scenario(scenario, actual_returns), actual_returns
+
+
+# FUNC: Builds the summary row of a scenario from the actual (after fee) return
+# multiple of every fund
+def summarize_scenario(scenario, actual_returns):
+    summary = {key: value for key, value in scenario.items() if key != "prob_dist"}
+    summary.update(zip(PROB_DIST_COLUMNS, scenario["prob_dist"]))
+    summary["alpha"] = calculate_alpha(scenario["average_yoy_growth"], scenario["average_exit_time"])
+    summary["mean_moic"] = actual_returns.mean()
+    for q, value in zip(QUANTILES, compute_quantiles(actual_returns, QUANTILES)):
+        summary["moic_p{:.0f}".format(100 * q)] = value
+        summary["cagr_p{:.0f}".format(100 * q)] = convert_moic_to_cagr(value, scenario["fund_lifespan"])
+    bucket_counts = np.bincount(fund_bucket_indices(actual_returns), minlength=len(FUND_BUCKETS))
+    for bucket, count in zip(FUND_BUCKETS, bucket_counts):
+        summary["pct_funds_" + bucket] = count / len(actual_returns)
+    summary["pct_beat_stock_market"] = np.mean(actual_returns > 1.10 ** scenario["fund_lifespan"])
+    return summary
+
+
+# FUNC: Simulates every scenario, sharding whole scenarios across a process
+# pool when workers > 1. Returns a summary DataFrame (one row per scenario)
+# and the list of per-fund actual return arrays. Scenarios without their own
+# seed get an independent child stream of seed
+def run_batch(scenarios, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    import pandas as pd
+
+    scenarios = [normalize_scenario(scenario, i) for i, scenario in enumerate(scenarios)]
+    seeds = as_seed_sequence(seed).spawn(len(scenarios)) if seed is not None else [None] * len(scenarios)
+    run = partial(run_scenario, chunk_size=chunk_size)
+
+    if workers is None or workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            if instrumentation.is_enabled():
+                # Stages run in the workers; bring their statistics back here
+                recorded = list(executor.map(partial(instrumentation.call_recorded, run),
+                                             scenarios, seeds))
+                for _, stats in recorded:
+                    instrumentation.merge(stats)
+                results = [result for result, _ in recorded]
+            else:
+                results = list(executor.map(run, scenarios, seeds))
+    else:
+        results = [run(scenario, scenario_seed) for scenario, scenario_seed in zip(scenarios, seeds)]
+
+    summary = pd.DataFrame([row for row, _ in results])
+    return summary, [fund_returns for _, fund_returns in results]
+
+
+# FUNC: Writes the batch results to a .parquet, .csv or .npz file. Per-fund
+# returns are only written to NPZ output, as fund_returns_<row>
+def write_results(summary, path, fund_returns=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".parquet":
+        summary.to_parquet(path, index=False)
+    elif extension == ".csv":
+        summary.to_csv(path, index=False)
+    elif extension == ".npz":
+        from pandas.api.types import is_numeric_dtype
+        arrays = {column: (summary[column].to_numpy() if is_numeric_dtype(summary[column])
+                           else summary[column].astype(str).to_numpy(dtype=str))
+                  for column in summary.columns}
+        for i, returns in enumerate(fund_returns or []):
+            arrays["fund_returns_{}".format(i)] = returns
+        np.savez(path, **arrays)
+    else:
+        raise ValueError("Unsupported output file type: {}".format(extension))
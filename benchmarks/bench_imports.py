@@ -0,0 +1,93 @@
+"""
+Import-time benchmark for the app's cold start.
+
+Imports each module in a fresh interpreter and records the cumulative import
+time that python -X importtime reports for it, plus which heavy dependencies
+(pandas, scipy, matplotlib, powerlaw) the import pulled in. Results are saved
+as JSON so two commits can be compared, like bench_library.py.
+
+Usage (from the repository root):
+    python benchmarks/bench_imports.py -o before.json
+    python benchmarks/bench_imports.py -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = ["library", "cache", "jobs", "charts", "multipage",
+                   "pages.simulator", "pages.growth_rates"]
+HEAVY_MODULES = ["pandas", "scipy", "matplotlib", "powerlaw"]
+
+# Prints the heavy modules that are loaded once the import has finished
+REPORT_LOADED = "import sys, json; print(json.dumps([m for m in {} if m in sys.modules]))"
+
+
+# FUNC: Imports module in a fresh interpreter, returning its cumulative import
+# time in seconds and the heavy modules it loaded
+def import_time(module):
+    code = "import {}; {}".format(module, REPORT_LOADED.format(HEAVY_MODULES))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, None, result.stderr.strip().splitlines()[-1]
+
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1e6, json.loads(result.stdout), None
+    return None, json.loads(result.stdout), "no importtime line for " + module
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import times.")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("-o", "--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON results of a previous run to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="slowdown (as a fraction) reported as a regression")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "results": []}
+    print("{:<24} {:>10}  {}".format("module", "seconds", "heavy modules loaded"))
+    for module in args.modules:
+        timings, loaded, error = [], None, None
+        for _ in range(args.repeats):
+            seconds, loaded, error = import_time(module)
+            if seconds is None:
+                break
+            timings.append(seconds)
+        row = {"module": module, "seconds": min(timings) if timings else None,
+               "heavy_modules": loaded, "error": error}
+        results["results"].append(row)
+        if row["seconds"] is None:
+            print("{:<24} {:>10}  {}".format(module, "failed", error))
+        else:
+            print("{:<24} {:>10.4f}  {}".format(module, row["seconds"], ", ".join(loaded) or "-"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {row["module"]: row["seconds"] for row in json.load(f)["results"]}
+        regressions = [(row["module"], baseline[row["module"]], row["seconds"])
+                       for row in results["results"]
+                       if row["seconds"] is not None and baseline.get(row["module"])
+                       and row["seconds"] > baseline[row["module"]] * (1.0 + args.threshold)]
+        for module, before, after in regressions:
+            print("REGRESSION {}: {:.4f}s -> {:.4f}s ({:+.0%})".format(
+                module, before, after, after / before - 1.0))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
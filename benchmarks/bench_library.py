@@ -0,0 +1,236 @@
+"""
+Benchmark suite for the hot paths in library.py.
+
+Times every stage of the simulation pipeline across a matrix of
+simulation_runs x portfolio_size, recording wall time, throughput in company
+draws per second and peak traced memory. Results are saved as JSON so two
+commits can be compared, and a two-sample KS test checks that the vectorized
+engine draws from the same distribution as the per-company reference. The
+analytic engine (analytic.py) is cross-checked against Monte Carlo runs, and
+the script fails if they disagree.
+
+Usage (from the repository root):
+    python benchmarks/bench_library.py -o before.json
+    python benchmarks/bench_library.py -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import library
+from analytic import cross_check_monte_carlo, fund_return_distribution
+from pareto import validate_sampler
+
+PROB_DIST = [0.33, 0.33, 0.33]
+LIQUIDATION_PCT = 0.8
+AVERAGE_YOY_GROWTH = 0.25
+AVERAGE_EXIT_TIME = 5
+SEED = 2022
+
+DEFAULT_SIZES = ["100x10", "1000x50", "2500x50", "10000x100", "100000x1000"]
+
+# Portfolio sizes at which the analytic engine is cross-checked against a
+# 200,000-fund Monte Carlo run, and the largest deviations tolerated
+ANALYTIC_PORTFOLIO_SIZES = [1, 10, 50, 200]
+ANALYTIC_MAX_KS = 0.01
+ANALYTIC_MAX_RELATIVE_ERROR = 0.10
+
+
+# Each stage takes the inputs prepared for a size and returns nothing of
+# interest. Stages that build Python lists of every company outcome are skipped
+# above max_draws, where they would need tens of gigabytes
+STAGES = [
+    {"name": "simulate_multiple_funds", "max_draws": 10**7,
+     "run": lambda inputs: library.simulate_multiple_funds(
+         PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH, AVERAGE_EXIT_TIME,
+         inputs["portfolio_size"], inputs["runs"], seed=SEED)},
+    {"name": "simulate_fund_matrix", "max_draws": None,
+     "run": lambda inputs: library.simulate_fund_matrix(
+         PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH, AVERAGE_EXIT_TIME,
+         inputs["portfolio_size"], inputs["runs"], seed=SEED)},
+    {"name": "simulate_fund_returns", "max_draws": None,
+     "run": lambda inputs: library.simulate_fund_returns(
+         PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH, AVERAGE_EXIT_TIME,
+         inputs["portfolio_size"], inputs["runs"], seed=SEED)},
+    {"name": "calculate_raw_fund_returns", "max_draws": None,
+     "run": lambda inputs: library.calculate_raw_fund_returns(inputs["matrix"])},
+    {"name": "analyze_fund_returns", "max_draws": 10**7,
+     "run": lambda inputs: library.analyze_fund_returns(
+         inputs["matrix"], inputs["raw_returns"], inputs["portfolio_size"])},
+    {"name": "analyze_fund_frame", "max_draws": None,
+     "run": lambda inputs: library.analyze_fund_frame(inputs["matrix"], inputs["raw_returns"])},
+    {"name": "get_averages_for_variable_across_buckets", "max_draws": 10**7,
+     "run": lambda inputs: [library.get_averages_for_variable_across_buckets(inputs["analysis_list"], var)
+                            for var in inputs["variables"]]},
+    {"name": "get_bucket_averages", "max_draws": None,
+     "run": lambda inputs: library.get_bucket_averages(inputs["analysis_frame"])},
+    {"name": "fund_return_distribution", "max_draws": None,
+     "run": lambda inputs: fund_return_distribution(
+         PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH, AVERAGE_EXIT_TIME,
+         inputs["portfolio_size"])},
+]
+
+
+# FUNC: Parses "RUNSxPORTFOLIO_SIZE" into a pair of ints
+def parse_size(size):
+    runs, portfolio_size = size.lower().split("x")
+    return int(runs), int(portfolio_size)
+
+
+# FUNC: Prepares the (untimed) inputs the analysis stages work on
+def prepare_inputs(runs, portfolio_size):
+    matrix = library.simulate_fund_matrix(PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH,
+                                          AVERAGE_EXIT_TIME, portfolio_size, runs, seed=SEED)
+    raw_returns = library.calculate_raw_fund_returns(matrix)
+    analysis_frame = library.analyze_fund_frame(matrix, raw_returns)
+    inputs = {"runs": runs, "portfolio_size": portfolio_size, "matrix": matrix,
+              "raw_returns": raw_returns, "analysis_frame": analysis_frame,
+              "variables": [column for column in analysis_frame.columns if column != "bucket"]}
+    if runs * portfolio_size <= 10**7:
+        inputs["analysis_list"] = library.analyze_fund_returns(matrix, raw_returns, portfolio_size)
+    return inputs
+
+
+# FUNC: Times one stage, returning the best wall time over repeats and the
+# peak memory traced during a separate run
+def time_stage(stage, inputs, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        stage["run"](inputs)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    stage["run"](inputs)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak_bytes
+
+
+# FUNC: Compares the distribution of company outcomes drawn by the vectorized
+# engine against the per-company simulate_single_draw reference
+def check_equivalence(draws=20000):
+    from scipy.stats import ks_2samp
+
+    alpha = library.calculate_alpha(AVERAGE_YOY_GROWTH, AVERAGE_EXIT_TIME)
+    np.random.seed(SEED)
+    reference = np.array([library.simulate_single_draw(alpha, LIQUIDATION_PCT, PROB_DIST)
+                          for _ in range(draws)])
+    vectorized = library.simulate_fund_matrix(PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH,
+                                              AVERAGE_EXIT_TIME, 100, draws // 100,
+                                              seed=SEED).ravel()
+    result = ks_2samp(reference, vectorized)
+    return {"draws": draws, "ks_statistic": float(result.statistic), "p_value": float(result.pvalue),
+            "power_law_sampler": validate_sampler(alpha, draws, seed=SEED),
+            "analytic_engine": [cross_check_monte_carlo(PROB_DIST, LIQUIDATION_PCT,
+                                                        AVERAGE_YOY_GROWTH, AVERAGE_EXIT_TIME,
+                                                        portfolio_size, seed=SEED)
+                                for portfolio_size in ANALYTIC_PORTFOLIO_SIZES]}
+
+
+# FUNC: Describes the environment the benchmark ran in
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+# FUNC: Lists the stages that got slower than the baseline by more than
+# threshold (a fraction, e.g. 0.1 for 10%)
+def find_regressions(results, baseline, threshold):
+    baseline_seconds = {(r["stage"], r["runs"], r["portfolio_size"]): r["seconds"]
+                        for r in baseline["results"] if r.get("seconds") is not None}
+    regressions = []
+    for result in results["results"]:
+        key = (result["stage"], result["runs"], result["portfolio_size"])
+        if result.get("seconds") is None or key not in baseline_seconds:
+            continue
+        ratio = result["seconds"] / baseline_seconds[key]
+        if ratio > 1.0 + threshold:
+            regressions.append((key, baseline_seconds[key], result["seconds"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the library.py hot paths.")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES,
+                        help="RUNSxPORTFOLIO_SIZE pairs, e.g. 2500x50")
+    parser.add_argument("--stages", nargs="+", default=[stage["name"] for stage in STAGES])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("-o", "--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON results of a previous run to flag regressions against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="slowdown (as a fraction) reported as a regression")
+    parser.add_argument("--skip-equivalence", action="store_true")
+    args = parser.parse_args()
+
+    results = {"environment": environment(), "results": []}
+    print("{:<42} {:>14} {:>10} {:>15} {:>12}".format("stage", "size", "seconds", "draws/sec", "peak MiB"))
+    for size in args.sizes:
+        runs, portfolio_size = parse_size(size)
+        draws = runs * portfolio_size
+        inputs = prepare_inputs(runs, portfolio_size)
+        for stage in STAGES:
+            if stage["name"] not in args.stages:
+                continue
+            row = {"stage": stage["name"], "runs": runs, "portfolio_size": portfolio_size}
+            if stage["max_draws"] is not None and draws > stage["max_draws"]:
+                row.update(seconds=None, skipped=True)
+                print("{:<42} {:>14} {:>10}".format(stage["name"], size, "skipped"))
+            else:
+                seconds, peak_bytes = time_stage(stage, inputs, args.repeats)
+                row.update(seconds=seconds, draws_per_sec=draws / seconds, peak_bytes=peak_bytes)
+                print("{:<42} {:>14} {:>10.4f} {:>15,.0f} {:>12.1f}".format(
+                    stage["name"], size, seconds, draws / seconds, peak_bytes / 2**20))
+            results["results"].append(row)
+        del inputs
+
+    if not args.skip_equivalence:
+        results["equivalence"] = check_equivalence()
+        print("KS test vs. simulate_single_draw: statistic={ks_statistic:.4f}, "
+              "p-value={p_value:.3f}".format(**results["equivalence"]))
+        print("KS test of the power-law sampler vs. the powerlaw package: statistic="
+              "{ks_statistic_powerlaw:.4f}, p-value={p_value_powerlaw:.3f}".format(
+                  **results["equivalence"]["power_law_sampler"]))
+        for check in results["equivalence"]["analytic_engine"]:
+            print("Analytic engine vs. Monte Carlo, portfolio size {portfolio_size}: KS statistic="
+                  "{ks_statistic:.4f}, max quantile error={max_relative_error:.2%}".format(**check))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold)
+        for (stage, runs, portfolio_size), before, after, ratio in regressions:
+            print("REGRESSION {} {}x{}: {:.4f}s -> {:.4f}s ({:+.0%})".format(
+                stage, runs, portfolio_size, before, after, ratio - 1.0))
+        if regressions:
+            sys.exit(1)
+
+    if not args.skip_equivalence and any(
+            check["ks_statistic"] > ANALYTIC_MAX_KS
+            or check["max_relative_error"] > ANALYTIC_MAX_RELATIVE_ERROR
+            for check in results["equivalence"]["analytic_engine"]):
+        print("MISMATCH between the analytic engine and Monte Carlo")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
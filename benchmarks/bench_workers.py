@@ -0,0 +1,53 @@
+"""
+Scaling benchmark for the process-pool execution mode of
+library.simulate_fund_returns.
+
+Usage (from the repository root):
+    python benchmarks/bench_workers.py --runs 100000 --portfolio-size 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from library import DEFAULT_CHUNK_SIZE, simulate_fund_returns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20000)
+    parser.add_argument("--portfolio-size", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=2022)
+    args = parser.parse_args()
+
+    draws = args.runs * args.portfolio_size
+    print("{} funds x {} companies = {:,} draws".format(args.runs, args.portfolio_size, draws))
+    print("{:>8} {:>10} {:>14} {:>9}".format("workers", "seconds", "draws/sec", "speedup"))
+
+    baseline_time = None
+    baseline_returns = None
+    for workers in args.workers:
+        start = time.perf_counter()
+        returns = simulate_fund_returns([1/3, 1/3, 1/3], 0.8, 0.25, 5, args.portfolio_size,
+                                        args.runs, seed=args.seed,
+                                        chunk_size=args.chunk_size, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        if baseline_time is None:
+            baseline_time, baseline_returns = elapsed, returns
+        elif not np.array_equal(returns, baseline_returns):
+            raise SystemExit("workers={} did not reproduce the single-process result".format(workers))
+
+        print("{:>8} {:>10.3f} {:>14,.0f} {:>8.2f}x".format(workers, elapsed, draws / elapsed,
+                                                          baseline_time / elapsed))
+
+
+if __name__ == "__main__":
+    main()
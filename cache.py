@@ -0,0 +1,260 @@
+"""
+Result cache for the simulation stage.
+
+Simulation results are stored as a dict of named ndarrays, keyed on a
+canonical hash of the parameters that affect the random draws. Parameters
+that only affect post-processing (management fee, fund lifespan, carry) are
+deliberately left out of the key, so changing them reuses the cached draws.
+
+The module-level default_cache is shared across all sessions of a Streamlit
+server process, so identical seeded runs are computed once per process.
+Concurrent requests for the same key wait on a single in-flight computation.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+from instrumentation import count, timed
+from library import iter_fund_chunks, normalize_prob_dist
+from reducers import CompositionReducer, FundReturnReducer, reduce_fund_chunks
+from sweep import sweep_growth_rates
+
+# Default in-memory budget of the module-level cache, overridable through the
+# VC_SIM_CACHE_BYTES environment variable
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# Default budget of the on-disk tier, overridable through the
+# VC_SIM_CACHE_DISK_BYTES environment variable
+DEFAULT_DISK_BYTES = 2 * 1024 * 1024 * 1024
+
+# Statistics every SimulationCache keeps; see SimulationCache.metrics
+CACHE_STATS = ["hits", "misses", "coalesced", "evictions", "disk_evictions"]
+
+
+# FUNC: Builds a canonical hash of the parameters that determine a simulation's
+# draws. Floats are rounded so that e.g. 0.1 + 0.2 and 0.3 share a key
+def simulation_key(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs, seed, **extra):
+    params = {
+        "prob_dist": [round(float(p), 12) for p in normalize_prob_dist(prob_dist)],
+        "liquidation_pct": round(float(liquidation_pct), 12),
+        "average_yoy_growth": round(float(average_yoy_growth), 12),
+        "average_exit_time": round(float(average_exit_time), 12),
+        "portfolio_size": int(portfolio_size),
+        "simulation_runs": int(simulation_runs),
+        "seed": int(seed),
+    }
+    params.update(extra)
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SimulationCache:
+    """Thread-safe LRU of simulation results with a byte budget and an optional
+    on-disk tier.
+
+    One instance (default_cache) is shared by every Streamlit session in the
+    server process. Requests for a key that is being computed are coalesced:
+    the first caller computes it and every concurrent caller waits for that
+    result instead of launching its own computation.
+
+    Args:
+        max_bytes: total size of the ndarrays kept in memory before the least
+            recently used entries are evicted
+        disk_dir: directory in which every entry is also saved as <key>.npz;
+            entries evicted from memory are reloaded from there
+        max_disk_bytes: total size of the .npz files kept in disk_dir before
+            the least recently used ones are deleted
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, disk_dir=None, max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.stats = dict.fromkeys(CACHE_STATS, 0)
+        self._lock = threading.RLock()
+        self._in_flight = {}
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __contains__(self, key):
+        return key in self.entries or (self.disk_dir is not None
+                                       and os.path.exists(self._disk_path(key)))
+
+    def get(self, key):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            if self.disk_dir is not None and os.path.exists(self._disk_path(key)):
+                with np.load(self._disk_path(key)) as npz:
+                    value = {name: npz[name] for name in npz.files}
+                # Mark the file as recently used for the disk budget
+                os.utime(self._disk_path(key))
+                self._store(key, value)
+                return value
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            if self.disk_dir is not None:
+                np.savez(self._disk_path(key), **value)
+                self._trim_disk()
+            self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            value = self.get(key)
+            if value is not None:
+                self._record("hits")
+                return value
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                in_flight = self._in_flight[key] = Future()
+                self._record("misses")
+                owner = True
+            else:
+                self._record("coalesced")
+                owner = False
+
+        if not owner:
+            return in_flight.result()
+        try:
+            value = compute()
+            self.put(key, value)
+            in_flight.set_result(value)
+            return value
+        except BaseException as error:
+            in_flight.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def metrics(self):
+        """Returns the hit, miss, coalesced and eviction counts along with the
+        current number of entries, bytes and in-flight computations."""
+        with self._lock:
+            return {**self.stats, "entries": len(self.entries), "bytes": self.nbytes,
+                    "max_bytes": self.max_bytes, "in_flight": len(self._in_flight)}
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def _record(self, stat):
+        self.stats[stat] += 1
+        count("cache_" + stat)
+
+    def _store(self, key, value):
+        size = sum(array.nbytes for array in value.values())
+        if key in self.entries:
+            self.nbytes -= sum(array.nbytes for array in self.entries.pop(key).values())
+        if size > self.max_bytes:
+            return
+        self.entries[key] = value
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.nbytes -= sum(array.nbytes for array in evicted.values())
+            self._record("evictions")
+
+    def _trim_disk(self):
+        """Deletes the least recently used .npz files until the disk tier fits
+        in max_disk_bytes."""
+        paths = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir)
+                 if name.endswith(".npz")]
+        files = sorted((os.stat(path).st_mtime, os.path.getsize(path), path) for path in paths)
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self._record("disk_evictions")
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key + ".npz")
+
+
+default_cache = SimulationCache(
+    max_bytes=int(os.environ.get("VC_SIM_CACHE_BYTES", DEFAULT_CACHE_BYTES)),
+    disk_dir=os.environ.get("VC_SIM_CACHE_DIR"),
+    max_disk_bytes=int(os.environ.get("VC_SIM_CACHE_DISK_BYTES", DEFAULT_DISK_BYTES)))
+
+
+# FUNC: Runs (or fetches from the cache) the simulation and analysis stages,
+# returning the raw fund returns and the CompositionReducer for the parameters.
+# Unseeded runs cannot be reproduced and therefore bypass the cache
+@timed("cache.cached_simulation")
+def cached_simulation(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs, seed=None, sampling="random", cache=None):
+    if cache is None:
+        cache = default_cache
+
+    def compute():
+        fund_returns, fund_composition = reduce_fund_chunks(
+            iter_fund_chunks(prob_dist, liquidation_pct, average_yoy_growth,
+                             average_exit_time, portfolio_size, simulation_runs, seed,
+                             sampling=sampling),
+            [FundReturnReducer(), CompositionReducer()])
+        return {"raw_returns": fund_returns.result(), **fund_composition.to_arrays()}
+
+    if seed is None:
+        result = compute()
+    else:
+        key = composition_key(prob_dist, liquidation_pct, average_yoy_growth,
+                              average_exit_time, portfolio_size, simulation_runs, seed,
+                              sampling)
+        result = cache.get_or_compute(key, compute)
+    return result["raw_returns"], CompositionReducer.from_arrays(result)
+
+
+# FUNC: Builds the cache key of cached_simulation's result, which background
+# jobs (see jobs.py) also store their finished results under
+def composition_key(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs, seed, sampling="random"):
+    return simulation_key(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time,
+                          portfolio_size, simulation_runs, seed, stage="composition",
+                          sampling=sampling)
+
+
+# FUNC: Size in bytes of the float32 (growth rates x funds) matrix that
+# cached_growth_sweep stores
+def growth_sweep_nbytes(n_growth_rates, simulation_runs):
+    return int(n_growth_rates) * int(simulation_runs) * np.dtype(np.float32).itemsize
+
+
+# FUNC: Runs (or fetches from the cache) a growth-rate sweep, returning the
+# (growth rates x funds) float32 matrix of raw fund returns. Sweeps larger than
+# the cache's budget cannot be kept, and are recomputed on every call
+@timed("cache.cached_growth_sweep")
+def cached_growth_sweep(prob_dist, liquidation_pct, growth_rates, average_exit_time, portfolio_size, simulation_runs, seed=None, sampling="random", cache=None):
+    if cache is None:
+        cache = default_cache
+
+    def compute():
+        return {"raw_returns": sweep_growth_rates(prob_dist, liquidation_pct, growth_rates,
+                                                  average_exit_time, portfolio_size,
+                                                  simulation_runs, seed, sampling=sampling,
+                                                  dtype=np.float32)}
+
+    if seed is None:
+        return compute()["raw_returns"]
+    if growth_sweep_nbytes(len(growth_rates), simulation_runs) > cache.max_bytes:
+        warnings.warn("The growth-rate sweep needs {:,} bytes, more than the cache budget of "
+                      "{:,} bytes, so it is recomputed on every run".format(
+                          growth_sweep_nbytes(len(growth_rates), simulation_runs),
+                          cache.max_bytes), RuntimeWarning)
+    key = simulation_key(prob_dist, liquidation_pct, 0.0, average_exit_time,
+                         portfolio_size, simulation_runs, seed, stage="growth_sweep",
+                         growth_rates=[round(float(g), 12) for g in growth_rates],
+                         sampling=sampling)
+    return cache.get_or_compute(key, compute)["raw_returns"]
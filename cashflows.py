@@ -0,0 +1,145 @@
+"""
+Time-resolved cash-flow simulation.
+
+convert_moic_to_cagr assumes all capital goes in at year 0 and comes back at
+the end of the fund's life. This mode also gives every company a timeline:
+  - Capital calls: management fees are called every year of the fund's life,
+    and the equal-sized checks are paced evenly over the investment period.
+  - Exits: each company is held for a geometrically distributed number of
+    years with mean average_exit_time. Companies that have not exited by the
+    end of the fund lifespan are held as residual NAV at their multiple.
+
+Cash flows are from the LPs' perspective, net of management fees and before
+carried interest, on one unit of committed capital. IRR, TVPI and DPI are
+computed for every fund at once; IRR uses batched Newton iterations with a
+vectorized bisection fallback.
+"""
+
+import numpy as np
+
+from library import (DEFAULT_CHUNK_SIZE, calculate_alpha, plan_chunks,
+                     simulate_chunk)
+
+
+# FUNC: Builds the yearly cash flows of one chunk of simulated company
+# multiples: the (fund_lifespan + 1) vector of contributions shared by every
+# fund, the (funds x fund_lifespan + 1) matrix of distributions and the
+# residual NAV of each fund
+def build_cash_flows(multiples, mgmt_pct_fee, average_exit_time, fund_lifespan, investment_period, rng):
+    runs, portfolio_size = multiples.shape
+    years = int(fund_lifespan) + 1
+    check_size = (1.0 - mgmt_pct_fee * fund_lifespan) / portfolio_size
+
+    # Checks are paced evenly over the investment period, fees are called yearly
+    investment_years = (np.arange(portfolio_size) * int(investment_period)) // portfolio_size
+    contributions = np.bincount(investment_years, minlength=years)[:years] * check_size
+    contributions[:int(fund_lifespan)] += mgmt_pct_fee
+
+    exit_years = investment_years + rng.geometric(1.0 / max(average_exit_time, 1.0),
+                                                  size=(runs, portfolio_size))
+    exited = exit_years <= fund_lifespan
+    proceeds = multiples * check_size
+
+    # One bincount over (fund, year) pairs places every exit's proceeds
+    flat_years = (np.where(exited, exit_years, 0) + years * np.arange(runs)[:, np.newaxis]).ravel()
+    distributions = np.bincount(flat_years, weights=np.where(exited, proceeds, 0.0).ravel(),
+                                minlength=runs * years).reshape(runs, years)
+    residual_nav = np.where(exited, 0.0, proceeds).sum(axis=1)
+    return contributions, distributions, residual_nav
+
+
+# FUNC: Net present value of yearly cash flows (funds x years) at the rate of
+# each fund, along with its derivative with respect to the rate
+def npv_and_derivative(cash_flows, rates):
+    years = np.arange(cash_flows.shape[1])
+    discount = np.power(1.0 + rates[:, np.newaxis], -years)
+    npv = (cash_flows * discount).sum(axis=1)
+    derivative = (-years * cash_flows * discount / (1.0 + rates[:, np.newaxis])).sum(axis=1)
+    return npv, derivative
+
+
+# FUNC: Computes the IRR of every fund's yearly cash flows at once with batched
+# Newton iterations; funds that do not converge are solved by bisection. Funds
+# that never get anything back have an IRR of -100%, and NaN marks funds
+# whose cash flows have no IRR
+def batched_irr(cash_flows, guess=None, max_iterations=50, tolerance=1e-10):
+    cash_flows = np.asarray(cash_flows, dtype=np.float64)
+    runs = cash_flows.shape[0]
+    lower_bound, upper_bound = -0.9999, 1e6
+
+    rates = np.full(runs, 0.1) if guess is None else np.clip(np.asarray(guess, dtype=np.float64),
+                                                            lower_bound + 1e-6, upper_bound)
+    converged = np.zeros(runs, dtype=bool)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        for _ in range(max_iterations):
+            active = ~converged
+            if not active.any():
+                break
+            npv, derivative = npv_and_derivative(cash_flows[active], rates[active])
+            step = np.where(derivative != 0, npv / derivative, np.nan)
+            updated = np.clip(rates[active] - step, lower_bound, upper_bound)
+            ok = np.isfinite(updated)
+            rates[active] = np.where(ok, updated, rates[active])
+            converged[active] = ok & (np.abs(step) < tolerance)
+
+        # Bisection fallback on the funds Newton could not settle
+        unresolved = np.flatnonzero(~converged)
+        if unresolved.size:
+            flows = cash_flows[unresolved]
+            low = np.full(unresolved.size, lower_bound)
+            high = np.full(unresolved.size, upper_bound)
+            npv_low, _ = npv_and_derivative(flows, low)
+            npv_high, _ = npv_and_derivative(flows, high)
+            bracketed = np.sign(npv_low) != np.sign(npv_high)
+            for _ in range(200):
+                middle = 0.5 * (low + high)
+                npv_middle, _ = npv_and_derivative(flows, middle)
+                same_side = np.sign(npv_middle) == np.sign(npv_low)
+                low = np.where(same_side, middle, low)
+                npv_low = np.where(same_side, npv_middle, npv_low)
+                high = np.where(same_side, high, middle)
+            rates[unresolved] = np.where(bracketed, 0.5 * (low + high), np.nan)
+
+    rates[(cash_flows > 0).sum(axis=1) == 0] = -1.0
+    return rates
+
+
+# FUNC: Simulates several venture funds with timed cash flows, returning a dict
+# of per-fund "irr", "tvpi" and "dpi" arrays (plus the "cash_flows" matrix and
+# "residual_nav" when keep_cash_flows is set)
+def simulate_fund_cash_flows(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500, fund_lifespan=10, mgmt_pct_fee=0.02, investment_period=3, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, keep_cash_flows=False):
+    alpha = calculate_alpha(average_yoy_growth, average_exit_time)
+    results = {"irr": [], "tvpi": [], "dpi": []}
+    if keep_cash_flows:
+        results.update(cash_flows=[], residual_nav=[])
+
+    for start, stop, seed_seq in plan_chunks(simulation_runs, seed, chunk_size):
+        # The multiples match simulate_fund_matrix for the same seed; exit
+        # timing comes from a separate child stream of the chunk
+        multiples = simulate_chunk(prob_dist, liquidation_pct, alpha, portfolio_size,
+                                   stop - start, seed_seq)
+        timing_rng = np.random.default_rng(seed_seq.spawn(1)[0])
+        contributions, distributions, residual_nav = build_cash_flows(
+            multiples, mgmt_pct_fee, average_exit_time, fund_lifespan, investment_period,
+            timing_rng)
+
+        # Multiples use the gross flows; netting a year's exits against its
+        # capital call would understate the paid-in capital
+        paid_in = contributions.sum()
+        distributed = distributions.sum(axis=1)
+        tvpi = (distributed + residual_nav) / paid_in
+        cash_flows = distributions - contributions
+
+        # The residual NAV counts as a final distribution for the IRR
+        terminal_flows = cash_flows.copy()
+        terminal_flows[:, -1] += residual_nav
+        guess = np.power(np.maximum(tvpi, 1e-6), 1.0 / max(fund_lifespan / 2.0, 1.0)) - 1.0
+
+        results["irr"].append(batched_irr(terminal_flows, guess))
+        results["tvpi"].append(tvpi)
+        results["dpi"].append(distributed / paid_in)
+        if keep_cash_flows:
+            results["cash_flows"].append(cash_flows)
+            results["residual_nav"].append(residual_nav)
+
+    return {name: np.concatenate(arrays) for name, arrays in results.items()}
@@ -0,0 +1,216 @@
+"""
+Chart rendering for the Streamlit pages.
+
+Figures are built with matplotlib's object-oriented Figure API rather than
+pyplot, so they are never registered in pyplot's global figure list and cannot
+leak in long-lived server processes. Matplotlib is imported lazily, fonts and
+styling are loaded once per process (preload_theme does it in the background
+at startup), large scatter series are binned into a 2D histogram, and the rendered
+PNG bytes are cached on a content hash of the plotted data so unchanged charts
+are not rasterized again.
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+from instrumentation import count, timed
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Source_Sans_Pro")
+
+ACCENT_COLOR = "#14BAA6"
+BENCHMARK_COLOR = "#ef4444"
+SERIES_COLORS = ["#ef4444", "#eab308", "#3b82f6", "#22c55e", "#166534"]
+
+# Scatter plots with more points than this are drawn as a 2D histogram
+MAX_SCATTER_POINTS = 10000
+
+# Maximum total size of the rendered PNGs kept in memory
+CHART_CACHE_BYTES = 64 * 1024 * 1024
+
+# Shared by every session thread of the server process; guarded by _png_lock
+_png_cache = OrderedDict()
+_png_cache_bytes = 0
+_png_lock = threading.Lock()
+
+
+# FUNC: Loads the Source Sans Pro fonts once per process
+@lru_cache(maxsize=None)
+def load_theme():
+    from matplotlib import font_manager
+
+    def font(weight):
+        return font_manager.FontProperties(fname=os.path.join(FONT_DIR, "SourceSansPro-{}.ttf".format(weight)))
+
+    return {"regular": font("Regular"), "semibold": font("SemiBold"), "bold": font("Bold")}
+
+
+# FUNC: Imports matplotlib and loads the fonts on a background thread, once per
+# process, so the first chart does not pay for them. Returns the thread
+@lru_cache(maxsize=None)
+def preload_theme():
+    def preload():
+        with timed("charts.preload_theme"):
+            import matplotlib.backends.backend_agg
+            import matplotlib.figure
+            load_theme()
+
+    thread = threading.Thread(target=preload, daemon=True)
+    thread.start()
+    return thread
+
+
+# FUNC: Creates a figure and axes with the transparent background of the app
+def new_figure(figsize):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    for patch in (fig.patch, ax.patch):
+        patch.set_facecolor("#000000")
+        patch.set_alpha(0)
+    return fig, ax
+
+
+# FUNC: Applies the app's white-on-dark styling, title and axis labels
+def style_axes(ax, title, xlabel, ylabel, legend_offset=None):
+    theme = load_theme()
+    ax.tick_params(color="white", labelcolor="white")
+    for spine in ax.spines.values():
+        spine.set_edgecolor("white")
+    ax.set_title(title, color="white", fontproperties=theme["bold"], fontsize=18)
+    ax.set_xlabel(xlabel, color="white", fontproperties=theme["semibold"], fontsize=14)
+    ax.set_ylabel(ylabel, color="white", fontproperties=theme["semibold"], fontsize=14)
+    if legend_offset is not None:
+        legend = ax.legend(loc="upper center", bbox_to_anchor=(0.5, legend_offset), ncol=5, frameon=False)
+        for text in legend.get_texts():
+            text.set_color("white")
+            text.set_fontproperties(theme["regular"])
+            text.set_fontsize(12)
+    for label in ax.get_xticklabels() + ax.get_yticklabels():
+        label.set_fontproperties(theme["regular"])
+        label.set_fontsize(13)
+
+
+# FUNC: Histogram of values, binned with NumPy before plotting
+def histogram_chart(values, value_range, title, xlabel, ylabel, bins=10):
+    fig, ax = new_figure((12, 4))
+    counts, edges = np.histogram(values, bins=bins, range=value_range)
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge", color=ACCENT_COLOR)
+    style_axes(ax, title, xlabel, ylabel)
+    return fig
+
+
+# FUNC: Scatter plot of values against their index, with a dashed benchmark
+# line. Series longer than MAX_SCATTER_POINTS are drawn as a 2D histogram
+def index_scatter_chart(values, ylim, title, xlabel, ylabel, benchmark=None, marker_size=3):
+    from matplotlib.colors import LinearSegmentedColormap, LogNorm
+
+    fig, ax = new_figure((12, 6))
+    values = np.asarray(values, dtype=np.float64)
+    index = np.arange(len(values))
+    if len(values) > MAX_SCATTER_POINTS:
+        cmap = LinearSegmentedColormap.from_list("accent", ["#0b5d53", ACCENT_COLOR, "#ccfbf1"])
+        ax.hist2d(index, values, bins=(300, 150), range=[[0, len(values)], list(ylim)],
+                  cmin=1, cmap=cmap, norm=LogNorm())
+    else:
+        ax.scatter(x=index, y=values, color=ACCENT_COLOR, s=marker_size)
+    ax.set_ylim(*ylim)
+    if benchmark is not None:
+        ax.axhline(y=benchmark, color=BENCHMARK_COLOR, linestyle="dashed", linewidth=3)
+    style_axes(ax, title, xlabel, ylabel)
+    return fig
+
+
+# FUNC: Stacked bar chart; series is a list of (label, values, color)
+def stacked_bar_chart(labels, series, title, xlabel, ylabel):
+    fig, ax = new_figure((12, 6))
+    bottom = np.zeros(len(labels))
+    for label, values, color in series:
+        ax.bar(labels, values, label=label, bottom=bottom, color=color)
+        bottom = bottom + values
+    ax.set_ylim(0, 105)
+    style_axes(ax, title, xlabel, ylabel, legend_offset=-0.12)
+    return fig
+
+
+# FUNC: Scatter plot of several series against shared x values; series is a
+# list of (label, values, color), where label and color may be None
+def multi_scatter_chart(x, series, title, xlabel, ylabel, benchmark=None, ylim=None):
+    fig, ax = new_figure((12, 4))
+    for label, values, color in series:
+        ax.scatter(x=x, y=values, label=label, color=color)
+    if benchmark is not None:
+        ax.axhline(y=benchmark, color=BENCHMARK_COLOR, linestyle="dashed", linewidth=3)
+    if ylim is not None:
+        ax.set_ylim(*ylim)
+    has_legend = any(label is not None for label, _, _ in series)
+    style_axes(ax, title, xlabel, ylabel, legend_offset=-0.15 if has_legend else None)
+    return fig
+
+
+# FUNC: Hashes a chart function and its arguments, including the raw bytes of
+# any arrays, into a cache key
+def content_hash(chart, args):
+    digest = hashlib.sha256(chart.__name__.encode("utf-8"))
+
+    def update(value):
+        if isinstance(value, np.ndarray):
+            digest.update(str((value.dtype, value.shape)).encode("utf-8"))
+            digest.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, (list, tuple)):
+            digest.update(b"(")
+            for item in value:
+                update(item)
+            digest.update(b")")
+        elif isinstance(value, dict):
+            for key in sorted(value):
+                digest.update(str(key).encode("utf-8"))
+                update(value[key])
+        else:
+            digest.update(repr(value).encode("utf-8"))
+
+    update(args)
+    return digest.hexdigest()
+
+
+# FUNC: Renders chart(**kwargs) to PNG bytes, reusing the cached bytes when the
+# same chart has already been rendered with the same data
+def render_png(chart, **kwargs):
+    global _png_cache_bytes
+
+    key = content_hash(chart, kwargs)
+    with _png_lock:
+        png = _png_cache.get(key)
+        if png is not None:
+            _png_cache.move_to_end(key)
+    if png is not None:
+        count("chart_cache_hits")
+        return png
+
+    with timed("charts.import_matplotlib"):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    with timed("charts.build." + chart.__name__):
+        fig = chart(**kwargs)
+    with timed("charts.rasterize"):
+        FigureCanvasAgg(fig)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", bbox_inches="tight", transparent=True)
+        fig.clear()
+    png = buffer.getvalue()
+    count("chart_png_bytes", len(png))
+
+    with _png_lock:
+        if key not in _png_cache:
+            _png_cache[key] = png
+            _png_cache_bytes += len(png)
+        while _png_cache_bytes > CHART_CACHE_BYTES and len(_png_cache) > 1:
+            _, evicted = _png_cache.popitem(last=False)
+            _png_cache_bytes -= len(evicted)
+    return png
@@ -0,0 +1,48 @@
+"""
+Headless command line entry point for batch simulations.
+
+Usage:
+    python cli.py scenarios.json -o results.parquet --workers 8 --seed 2022
+"""
+
+import argparse
+import sys
+import time
+
+import instrumentation
+from batch import load_scenarios, run_batch, write_results
+from library import DEFAULT_CHUNK_SIZE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="vc-simulator",
+                                     description="Run venture fund simulations in batch without Streamlit.")
+    parser.add_argument("scenarios", help="JSON, YAML or CSV file with one parameter set per scenario")
+    parser.add_argument("-o", "--output", required=True,
+                        help="where to write results (.parquet, .csv or .npz)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes to run scenarios on")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="funds simulated per random stream and chunk")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="base seed; scenarios without their own seed get a child stream")
+    parser.add_argument("--fund-returns", action="store_true",
+                        help="also store every fund's return multiple (NPZ output only)")
+    parser.add_argument("--timings", default=None,
+                        help="record stage timings and write them here (.json, or .prom for Prometheus text)")
+    args = parser.parse_args(argv)
+
+    if args.timings:
+        instrumentation.enable()
+    scenarios = load_scenarios(args.scenarios)
+    start = time.perf_counter()
+    summary, fund_returns = run_batch(scenarios, args.seed, args.chunk_size, args.workers)
+    write_results(summary, args.output, fund_returns if args.fund_returns else None)
+    print("Simulated {} scenarios in {:.1f}s, results written to {}".format(
+        len(scenarios), time.perf_counter() - start, args.output), file=sys.stderr)
+    if args.timings:
+        instrumentation.dump(args.timings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Fee and carried interest waterfall.
+
+Works on NumPy arrays of raw (gross) fund return multiples per unit of
+committed capital. Every parameter broadcasts, so many fee structures can be
+applied at once, e.g. raw_returns[:, np.newaxis] against arrays of carry rates.
+
+The waterfall is settled over the whole fund (European style), which is what a
+clawback provision guarantees: the GP never keeps more than its carry share of
+the fund's total profits, whatever the timing of the exits.
+  1. Management fees: mgmt_pct_fee * fund_lifespan of committed capital is
+     never invested, so proceeds are raw_return * (1 - fees).
+  2. Return of capital: LPs get proceeds until they have their committed
+     capital back.
+  3. Preferred return: LPs get proceeds until they have earned the hurdle
+     rate, compounded annually over the fund lifespan.
+  4. GP catch-up: the GP gets catch_up_pct of proceeds until it holds carry_pct
+     of all profits distributed so far.
+  5. Split: the rest goes carry_pct to the GP and 1 - carry_pct to the LPs.
+"""
+
+import numpy as np
+
+
+# FUNC: Calculates the share of committed capital left for investment after
+# management fees
+def investable_capital(mgmt_pct_fee, fund_lifespan):
+    return 1.0 - np.multiply(mgmt_pct_fee, fund_lifespan)
+
+
+# FUNC: Splits the fund's proceeds (per unit of committed capital) between
+# LPs and the GP, returning (lp_distributions, gp_carry)
+def distribute_proceeds(proceeds, fund_lifespan, carry_pct=0.0, hurdle_rate=0.0, catch_up_pct=1.0):
+    proceeds, fund_lifespan, carry_pct, hurdle_rate, catch_up_pct = np.broadcast_arrays(
+        *[np.asarray(x, dtype=np.float64) for x in
+          (proceeds, fund_lifespan, carry_pct, hurdle_rate, catch_up_pct)])
+
+    # Tiers 2 and 3: return of capital, then the preferred return
+    preferred_return = np.power(1.0 + hurdle_rate, fund_lifespan) - 1.0
+    lp_priority = np.minimum(proceeds, 1.0 + preferred_return)
+    remaining = proceeds - lp_priority
+
+    # Tier 4: the catch-up tier ends once catch_up_pct * size equals
+    # carry_pct * (preferred_return + size); without a catch-up it is skipped
+    has_catch_up = (catch_up_pct > carry_pct) & (preferred_return > 0)
+    catch_up_size = np.divide(carry_pct * preferred_return, catch_up_pct - carry_pct,
+                              out=np.zeros_like(remaining), where=has_catch_up)
+    in_catch_up = np.minimum(remaining, catch_up_size)
+    gp_catch_up = np.where(has_catch_up, catch_up_pct * in_catch_up, 0.0)
+    lp_catch_up = in_catch_up - gp_catch_up
+    remaining = remaining - in_catch_up
+
+    # Tier 5: the carried interest split
+    gp_split = carry_pct * remaining
+    lp_distributions = lp_priority + lp_catch_up + remaining - gp_split
+    return lp_distributions, gp_catch_up + gp_split
+
+
+# FUNC: Converts raw fund return multiples into the LPs' net multiple on
+# committed capital after management fees and carried interest
+def net_fund_multiples(raw_returns, mgmt_pct_fee, fund_lifespan, carry_pct=0.0, hurdle_rate=0.0, catch_up_pct=1.0):
+    proceeds = np.asarray(raw_returns, dtype=np.float64) * investable_capital(mgmt_pct_fee, fund_lifespan)
+    lp_distributions, _ = distribute_proceeds(proceeds, fund_lifespan, carry_pct,
+                                              hurdle_rate, catch_up_pct)
+    return lp_distributions
+
+
+# FUNC: Applies several fee structures to the same funds at once. Each fee
+# structure is a dict of net_fund_multiples keyword arguments; returns a
+# (funds x fee structures) ndarray
+def apply_fee_structures(raw_returns, fee_structures):
+    keys = ["mgmt_pct_fee", "fund_lifespan", "carry_pct", "hurdle_rate", "catch_up_pct"]
+    defaults = {"carry_pct": 0.0, "hurdle_rate": 0.0, "catch_up_pct": 1.0}
+    columns = {key: np.array([structure.get(key, defaults.get(key)) for structure in fee_structures],
+                             dtype=np.float64) for key in keys}
+    return net_fund_multiples(np.asarray(raw_returns, dtype=np.float64)[:, np.newaxis], **columns)
@@ -0,0 +1,176 @@
+"""
+Multi-parameter scenario grid runner.
+
+A grid is a list of cells, each a (partial) batch scenario: see batch.py for
+the parameters and their units. Cells come from the Cartesian product of a
+few dimensions (product_grid) or from a Latin hypercube over parameter ranges
+(latin_hypercube_grid), and run_grid simulates them into one Parquet table
+with a summary row per cell.
+
+Common random numbers: every cell draws from the same seed, and cells that
+differ only in growth, exit time or fees are simulated together. Their
+outcome codes and uniforms are drawn once per chunk and re-mapped through each
+alpha (see sweep.py), and the fees are applied afterwards, so differences
+between those cells are never noise.
+
+The output path is a directory of Parquet part files, one per group of cells,
+which pandas and pyarrow read as a single table. Each row carries a cell_key
+hashed from the cell's parameters and seed; a restarted run skips the cells
+whose key is already there.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import instrumentation
+from batch import normalize_scenario, run_scenario, summarize_scenario
+from library import (DEFAULT_CHUNK_SIZE, as_seed_sequence, calculate_actual_fund_returns,
+                     calculate_alpha, normalize_prob_dist, stratified_uniforms)
+from sweep import sweep_alphas
+
+# Parameters that are rounded to whole numbers when sampled from a range
+INTEGER_PARAMETERS = {"portfolio_size", "simulation_runs", "fund_lifespan"}
+
+# Parameters that change the draws themselves; cells that agree on all of them
+# share one simulation
+DRAW_PARAMETERS = ["prob_dist", "liquidation_pct", "portfolio_size", "simulation_runs",
+                   "sampling", "seed", "engine"]
+
+
+# FUNC: Builds the Cartesian product of the given dimensions as a list of cells,
+# e.g. product_grid(portfolio_size=[20, 50], carry_pct=[0.2, 0.3])
+def product_grid(**dimensions):
+    names = list(dimensions)
+    return [dict(zip(names, values)) for values in itertools.product(*dimensions.values())]
+
+
+# FUNC: Samples n_cells cells from a Latin hypercube over the given dimensions.
+# A (low, high) tuple is sampled uniformly, a list is a set of choices (e.g.
+# prob_dist=[[0.5, 0.3, 0.2], [0.33, 0.33, 0.33]]). Every dimension gets one
+# value in each of the n_cells strata
+def latin_hypercube_grid(n_cells, seed=None, **dimensions):
+    rng = np.random.default_rng(as_seed_sequence(seed))
+    uniforms = stratified_uniforms(rng, (int(n_cells), len(dimensions)))
+
+    columns = {}
+    for (name, values), column in zip(dimensions.items(), uniforms.T):
+        if isinstance(values, tuple):
+            low, high = values
+            sampled = low + column * (high - low)
+            columns[name] = (np.rint(sampled).astype(int).tolist() if name in INTEGER_PARAMETERS
+                             else sampled.tolist())
+        else:
+            columns[name] = [values[i] for i in (column * len(values)).astype(int)]
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+# FUNC: Hashes a normalized cell and its seed into the key that identifies its
+# row in the output table
+def cell_key(cell, seed):
+    params = {key: value for key, value in cell.items() if key != "name"}
+    params["prob_dist"] = [round(float(p), 12) for p in normalize_prob_dist(params["prob_dist"])]
+    params["seed"] = params.get("seed", seed)
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=float)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+# FUNC: Groups cells that agree on every draw parameter, so each group is one
+# shared simulation. Returns a list of lists of cells, in first-seen order
+def group_cells(cells, seed):
+    groups = {}
+    for cell in cells:
+        draw = {**cell, "seed": cell.get("seed", seed)}
+        key = json.dumps([draw[name] for name in DRAW_PARAMETERS], default=float)
+        groups.setdefault(key, []).append(cell)
+    return list(groups.values())
+
+
+# FUNC: Simulates one group of cells on common random numbers and returns their
+# summary rows. Module level so it can run in a worker process
+def run_cell_group(cells, seed, chunk_size=DEFAULT_CHUNK_SIZE):
+    first = cells[0]
+    if first["engine"] == "analytic":
+        return [{"cell_key": cell["cell_key"],
+                 **run_scenario({key: value for key, value in cell.items()
+                                 if key != "cell_key"})[0]} for cell in cells]
+
+    alphas = sorted({calculate_alpha(cell["average_yoy_growth"], cell["average_exit_time"])
+                     for cell in cells})
+    raw_returns = sweep_alphas(first["prob_dist"], first["liquidation_pct"], alphas,
+                               first["portfolio_size"], first["simulation_runs"],
+                               first.get("seed", seed), chunk_size, first["sampling"])
+
+    rows = []
+    for cell in cells:
+        alpha = calculate_alpha(cell["average_yoy_growth"], cell["average_exit_time"])
+        actual_returns = calculate_actual_fund_returns(raw_returns[alphas.index(alpha)],
+                                                       cell["mgmt_pct_fee"], cell["fund_lifespan"],
+                                                       cell["carry_pct"], cell["hurdle_rate"],
+                                                       cell["catch_up_pct"])
+        rows.append({"cell_key": cell["cell_key"],
+                     **summarize_scenario({key: value for key, value in cell.items()
+                                           if key != "cell_key"}, actual_returns)})
+    return rows
+
+
+# FUNC: Returns the cell keys already written to the output directory
+def finished_cell_keys(path):
+    parts = [name for name in os.listdir(path) if name.endswith(".parquet")] if os.path.isdir(path) else []
+    if not parts:
+        return set()
+    return set(pd.read_parquet(path, columns=["cell_key"])["cell_key"])
+
+
+# FUNC: Writes the rows of one finished group as a part file. The file is
+# renamed into place, so an interrupted run never leaves a partial part behind
+def write_part(rows, path):
+    frame = pd.DataFrame(rows)
+    name = "part-{}.parquet".format(frame["cell_key"].iloc[0])
+    # Hidden files are ignored when the directory is read as a dataset
+    staging = os.path.join(path, "." + name)
+    frame.to_parquet(staging, index=False)
+    os.replace(staging, os.path.join(path, name))
+
+
+# FUNC: Simulates every cell of the grid that is not yet in the output
+# directory at path, scheduling the groups of cells across a process pool when
+# workers > 1, and returns the whole table. base holds the parameters shared by
+# every cell. Pass a seed to make the run reproducible and therefore resumable
+def run_grid(cells, path, base=None, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    if seed is None:
+        seed = int(as_seed_sequence().entropy % 2**63)
+    os.makedirs(path, exist_ok=True)
+
+    cells = [normalize_scenario({**(base or {}), **cell}, i) for i, cell in enumerate(cells)]
+    for cell in cells:
+        cell["cell_key"] = cell_key(cell, seed)
+    finished = finished_cell_keys(path)
+    groups = group_cells([cell for cell in cells if cell["cell_key"] not in finished], seed)
+
+    if groups and (workers is None or workers > 1):
+        recording = instrumentation.is_enabled()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Workers bring their stage statistics back when recording
+            futures = [executor.submit(instrumentation.call_recorded, run_cell_group, group, seed,
+                                       chunk_size) if recording
+                       else executor.submit(run_cell_group, group, seed, chunk_size)
+                       for group in groups]
+            for future in as_completed(futures):
+                rows = future.result()
+                if recording:
+                    rows, stats = rows
+                    instrumentation.merge(stats)
+                write_part(rows, path)
+    else:
+        for group in groups:
+            write_part(run_cell_group(group, seed, chunk_size), path)
+
+    table = pd.read_parquet(path).drop_duplicates("cell_key")
+    keys = [cell["cell_key"] for cell in cells]
+    return table.set_index("cell_key").loc[keys].reset_index()
@@ -0,0 +1,99 @@
+"""
+Importance sampling for tail statistics.
+
+Winner funds and extreme-outlier companies come from rare draws far out in the
+power law's tail, so plain simulation spends most funds on outcomes that say
+nothing about them. Here the "MULTIPLE" outcomes are drawn from a defensive
+mixture instead: with probability proposal_share from a heavier-tailed power
+law (exponent proposal_alpha < alpha), otherwise from the target itself. Each
+fund carries the likelihood ratio of its draws as a weight,
+
+    w = prod over its MULTIPLE companies of p(x) / ((1 - s) p(x) + s q(x)),
+
+where p and q are the target and proposal densities and s the proposal share.
+Keeping part of the target in the mixture bounds every company's ratio by
+1 / (1 - s), so no single fund can dominate. The weights have expectation 1
+and plug into the weighted reducers (reducers.py) and weighted_quantiles
+(quantiles.py). The outcome probabilities are not tilted, so funds draw the
+same number of "MULTIPLE" companies as in a plain simulation.
+"""
+
+import numpy as np
+
+from library import (DEFAULT_CHUNK_SIZE, OUTCOME_LIQUIDATION, OUTCOME_MULTIPLE,
+                     calculate_alpha, draw_chunk_uniforms, draw_outcome_codes,
+                     plan_chunks)
+from pareto import power_law_inverse_cdf
+
+# Share of the "MULTIPLE" draws taken from the heavier-tailed proposal
+DEFAULT_PROPOSAL_SHARE = 0.5
+
+
+# FUNC: Picks a proposal exponent that halves the distance of alpha to 1, which
+# makes the tail much heavier while keeping the weights' variance finite
+def default_proposal_alpha(alpha):
+    return 1.0 + (alpha - 1.0) / 2.0
+
+
+# FUNC: Turns uniforms into draws from the defensive mixture and returns them
+# with the log likelihood ratio of each draw. The uniform both picks the
+# mixture component and, rescaled, drives that component's inverse CDF
+def draw_mixture_multiples(uniforms, alpha, proposal_alpha, proposal_share=DEFAULT_PROPOSAL_SHARE):
+    if not 0.0 < proposal_share <= 1.0:
+        raise ValueError("proposal_share must be in (0, 1], got {}".format(proposal_share))
+    if proposal_alpha <= 1.0:
+        raise ValueError("proposal_alpha must be greater than 1, got {}".format(proposal_alpha))
+
+    from_proposal = uniforms < proposal_share
+    component_uniforms = np.where(from_proposal, uniforms / proposal_share,
+                                  (uniforms - proposal_share) / max(1.0 - proposal_share, 1e-300))
+    multiples = power_law_inverse_cdf(component_uniforms,
+                                      np.where(from_proposal, proposal_alpha, alpha))
+
+    # log(p / ((1 - s) p + s q)) = -log((1 - s) + s q / p), with
+    # log(q / p) = log((proposal_alpha - 1) / (alpha - 1)) + (alpha - proposal_alpha) log(x)
+    log_density_ratio = (np.log((proposal_alpha - 1.0) / (alpha - 1.0))
+                         + (alpha - proposal_alpha) * np.log(multiples))
+    with np.errstate(divide="ignore"):
+        log_target_share = np.log(1.0 - proposal_share)
+    log_weights = -np.logaddexp(log_target_share, np.log(proposal_share) + log_density_ratio)
+    return multiples, log_weights
+
+
+# FUNC: Simulates one chunk of funds with importance-sampled "MULTIPLE"
+# outcomes, returning the (funds x portfolio_size) outcomes and fund weights
+def simulate_weighted_chunk(prob_dist, liquidation_pct, alpha, portfolio_size, chunk_runs, seed_seq, proposal_alpha, proposal_share=DEFAULT_PROPOSAL_SHARE, sampling="random"):
+    outcome_uniforms, multiple_uniforms = draw_chunk_uniforms(chunk_runs, portfolio_size,
+                                                              seed_seq, sampling)
+    codes = draw_outcome_codes(prob_dist, outcome_uniforms)
+
+    outcomes = np.zeros(codes.shape, dtype=np.float64)
+    outcomes[codes == OUTCOME_LIQUIDATION] = liquidation_pct
+    is_multiple = codes == OUTCOME_MULTIPLE
+    multiples, log_weights = draw_mixture_multiples(multiple_uniforms[is_multiple], alpha,
+                                                    proposal_alpha, proposal_share)
+    outcomes[is_multiple] = multiples
+
+    company_log_weights = np.zeros(codes.shape, dtype=np.float64)
+    company_log_weights[is_multiple] = log_weights
+    return outcomes, np.exp(company_log_weights.sum(axis=1))
+
+
+# FUNC: Generator that simulates importance-sampled funds one chunk at a time,
+# yielding (outcomes, weights) pairs for reducers.reduce_weighted_fund_chunks.
+# proposal_alpha defaults to default_proposal_alpha(alpha)
+def iter_weighted_fund_chunks(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500, seed=None, proposal_alpha=None, proposal_share=DEFAULT_PROPOSAL_SHARE, chunk_size=DEFAULT_CHUNK_SIZE, sampling="random"):
+    alpha = calculate_alpha(average_yoy_growth, average_exit_time)
+    if proposal_alpha is None:
+        proposal_alpha = default_proposal_alpha(alpha)
+    for start, stop, seed_seq in plan_chunks(simulation_runs, seed, chunk_size):
+        yield simulate_weighted_chunk(prob_dist, liquidation_pct, alpha, portfolio_size,
+                                      stop - start, seed_seq, proposal_alpha,
+                                      proposal_share, sampling)
+
+
+# FUNC: Kish's effective sample size of a set of weights, i.e. how many
+# unweighted funds they are worth
+def effective_sample_size(weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights.sum() ** 2 / np.square(weights).sum()
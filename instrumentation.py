@@ -0,0 +1,193 @@
+"""
+Lightweight timing and counter instrumentation.
+
+Stages are timed with timed(), either as a context manager around a block or
+as a decorator on a function, and sizes are recorded with count() (draws,
+funds, bytes allocated, ...). Everything is off unless the VC_SIM_TIMINGS
+environment variable is set or enable() is called. While disabled, timed()
+hands back a shared no-op context and count() returns immediately, so the
+instrumented hot paths cost one flag check.
+
+The recorded statistics can be dumped as JSON or in the Prometheus text format,
+or written to the "vc_simulator.timings" logger. Statistics are kept per
+process: work submitted to ProcessPoolExecutor workers through call_recorded()
+returns its statistics with its result, and the parent adds them to its own
+with merge().
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+logger = logging.getLogger("vc_simulator.timings")
+
+_enabled = bool(os.environ.get("VC_SIM_TIMINGS"))
+_lock = threading.Lock()
+_timings = {}
+_counters = {}
+_disabled_context = nullcontext()
+
+
+# FUNC: Turns the instrumentation on or off for this process
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+# FUNC: Returns whether the instrumentation is recording
+def is_enabled():
+    return _enabled
+
+
+class _Timer:
+    """Context manager that adds the time spent in its block to a stage."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Stage:
+    """A named stage, usable as a context manager or as a decorator."""
+
+    def __init__(self, name):
+        self.name = name
+        self.timer = None
+
+    def __enter__(self):
+        self.timer = _Timer(self.name) if _enabled else _disabled_context
+        return self.timer.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self.timer.__exit__(*exc_info)
+
+    def __call__(self, func):
+        name = self.name
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_time(name, time.perf_counter() - start)
+
+        return wrapper
+
+
+# FUNC: Times a stage, as `with timed("name"):` or as `@timed("name")`
+def timed(name):
+    return Stage(name)
+
+
+# FUNC: Adds one call taking the given number of seconds to a stage
+def record_time(name, seconds):
+    with _lock:
+        stats = _timings.get(name)
+        if stats is None:
+            _timings[name] = {"calls": 1, "total_seconds": seconds, "max_seconds": seconds}
+        else:
+            stats["calls"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+
+# FUNC: Adds value to a counter, e.g. count("funds", 1000)
+def count(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+# FUNC: Clears every recorded timing and counter
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
+
+
+# FUNC: Returns a copy of the recorded timings and counters
+def snapshot():
+    with _lock:
+        return {"timings": {name: dict(stats) for name, stats in _timings.items()},
+                "counters": dict(_counters)}
+
+
+# FUNC: Adds statistics recorded by another process (a snapshot()) to this one
+def merge(stats):
+    with _lock:
+        for name, stage in stats["timings"].items():
+            current = _timings.get(name)
+            if current is None:
+                _timings[name] = dict(stage)
+            else:
+                current["calls"] += stage["calls"]
+                current["total_seconds"] += stage["total_seconds"]
+                current["max_seconds"] = max(current["max_seconds"], stage["max_seconds"])
+        for name, value in stats["counters"].items():
+            _counters[name] = _counters.get(name, 0) + value
+
+
+# FUNC: Calls func with the instrumentation on and returns its result together
+# with the statistics the call recorded. Meant to run in a worker process
+# (which may be reused), so the parent can merge() them
+def call_recorded(func, *args, **kwargs):
+    enable()
+    reset()
+    result = func(*args, **kwargs)
+    return result, snapshot()
+
+
+# FUNC: Serializes the recorded statistics as JSON
+def to_json(indent=2):
+    return json.dumps(snapshot(), indent=indent, sort_keys=True)
+
+
+# FUNC: Serializes the recorded statistics in the Prometheus text exposition
+# format, with one labelled series per stage and counter
+def to_prometheus(prefix="vc_simulator"):
+    stats = snapshot()
+    lines = []
+    for metric, field, kind in (("stage_calls_total", "calls", "counter"),
+                                ("stage_seconds_total", "total_seconds", "counter"),
+                                ("stage_seconds_max", "max_seconds", "gauge")):
+        lines.append("# TYPE {}_{} {}".format(prefix, metric, kind))
+        for name in sorted(stats["timings"]):
+            lines.append('{}_{}{{stage="{}"}} {!r}'.format(
+                prefix, metric, name, stats["timings"][name][field]))
+    lines.append("# TYPE {}_count_total counter".format(prefix))
+    for name in sorted(stats["counters"]):
+        lines.append('{}_count_total{{name="{}"}} {!r}'.format(prefix, name,
+                                                               stats["counters"][name]))
+    return "\n".join(lines) + "\n"
+
+
+# FUNC: Writes the recorded statistics to path, in the Prometheus text format
+# for .prom/.txt files and as JSON otherwise
+def dump(path):
+    text = to_prometheus() if os.path.splitext(path)[1] in (".prom", ".txt") else to_json()
+    with open(path, "w") as f:
+        f.write(text)
+
+
+# FUNC: Logs one structured record per stage and counter
+def log_timings(level=logging.INFO):
+    stats = snapshot()
+    for name, stage in sorted(stats["timings"].items()):
+        logger.log(level, "stage %s", name, extra={"stage": name, **stage})
+    for name, value in sorted(stats["counters"].items()):
+        logger.log(level, "counter %s=%s", name, value, extra={"counter": name, "value": value})
@@ -0,0 +1,208 @@
+"""
+Background simulation jobs for the Streamlit UI.
+
+A SimulationJob streams a simulation chunk by chunk on a background thread
+(optionally fanning the chunks out to a process pool) and folds each finished
+chunk into the same reducers cached_simulation uses. The page can take a
+snapshot of the partial results at any time to render progressively refined
+quantiles and charts, and cancel the job when its parameters go stale. Once a
+seeded job finishes, its result is stored in the simulation cache, so the next
+rerun with the same inputs is served from there.
+
+Seeded jobs are shared across sessions: a session asking for parameters that
+another session's job is already simulating subscribes to that job instead of
+starting its own. A shared job is only cancelled once every subscriber has
+released it.
+"""
+
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from cache import composition_key, default_cache
+from instrumentation import count
+from library import (DEFAULT_CHUNK_SIZE, calculate_alpha, plan_chunks,
+                     simulate_chunk)
+from reducers import CompositionReducer, FundReturnReducer
+
+
+# FUNC: Simulates one chunk of funds and reduces it to its raw returns and
+# composition sums. Module level so it can run in a worker process
+def reduce_chunk(prob_dist, liquidation_pct, alpha, portfolio_size, sampling, chunk):
+    start, stop, seed_seq = chunk
+    simulated_funds = simulate_chunk(prob_dist, liquidation_pct, alpha, portfolio_size,
+                                     stop - start, seed_seq, sampling)
+    fund_returns, fund_composition = FundReturnReducer(), CompositionReducer()
+    fund_returns.update(simulated_funds)
+    fund_composition.update(simulated_funds)
+    return fund_returns, fund_composition
+
+
+# Seeded jobs that are still running, keyed on their composition_key, so that
+# sessions asking for the same parameters share one job. The lock also guards
+# every job's subscriber count and cancellation, so a session can never
+# subscribe to a job that is being cancelled
+_running_jobs = {}
+_running_jobs_lock = threading.RLock()
+
+
+class SimulationJob:
+    """A streamed simulation running in the background.
+
+    Args:
+        workers: number of worker processes; 1 simulates on the job's thread
+        cache: SimulationCache that receives the result of a finished seeded
+            job (default_cache if None)
+    """
+
+    def __init__(self, prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs, seed=None, sampling="random", chunk_size=DEFAULT_CHUNK_SIZE, workers=1, cache=None):
+        self.params = (prob_dist, liquidation_pct, average_yoy_growth, average_exit_time,
+                       portfolio_size, simulation_runs, seed, sampling)
+        self.chunks = plan_chunks(simulation_runs, seed, chunk_size)
+        self.simulate = partial(reduce_chunk, prob_dist, liquidation_pct,
+                                calculate_alpha(average_yoy_growth, average_exit_time),
+                                int(portfolio_size), sampling)
+        self.workers = workers
+        self.cache = default_cache if cache is None else cache
+
+        self.fund_returns = FundReturnReducer()
+        self.fund_composition = CompositionReducer()
+        self.chunks_done = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.subscribers = 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Stops the job after the chunk(s) currently being simulated."""
+        with _running_jobs_lock:
+            self._cancelled.set()
+
+    def subscribe(self):
+        """Registers one more session interested in the job's result. Returns
+        None if the job has been cancelled or has finished."""
+        with _running_jobs_lock:
+            if self.cancelled or self.done:
+                return None
+            self.subscribers += 1
+            return self
+
+    def release(self):
+        """Drops one subscriber, cancelling the job when none are left."""
+        with _running_jobs_lock:
+            self.subscribers -= 1
+            if self.subscribers <= 0:
+                self.cancel()
+
+    def wait(self, timeout=None):
+        """Blocks until the job finishes or timeout seconds pass; returns done."""
+        self._thread.join(timeout)
+        return self.done
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def done(self):
+        return self._thread.ident is not None and not self._thread.is_alive()
+
+    @property
+    def progress(self):
+        """Fraction of chunks reduced so far, between 0.0 and 1.0."""
+        return self.chunks_done / len(self.chunks) if self.chunks else 1.0
+
+    def snapshot(self):
+        """Returns copies of the raw returns and the CompositionReducer of the
+        chunks finished so far."""
+        with self._lock:
+            return (self.fund_returns.result(),
+                    CompositionReducer.from_arrays(self.fund_composition.to_arrays()))
+
+    def _fold(self, chunk_reducers):
+        fund_returns, fund_composition = chunk_reducers
+        with self._lock:
+            self.fund_returns.merge(fund_returns)
+            self.fund_composition.merge(fund_composition)
+            self.chunks_done += 1
+
+    def _run(self):
+        try:
+            if self.workers is None or self.workers > 1:
+                with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                    # Results arrive in chunk order, so the raw returns line up
+                    # with a single-process run
+                    for chunk_reducers in executor.map(self.simulate, self.chunks):
+                        if self.cancelled:
+                            executor.shutdown(wait=False, cancel_futures=True)
+                            return
+                        self._fold(chunk_reducers)
+            else:
+                for chunk in self.chunks:
+                    if self.cancelled:
+                        return
+                    self._fold(self.simulate(chunk))
+
+            if self.params[6] is not None:
+                self.cache.put(composition_key(*self.params),
+                               {"raw_returns": self.fund_returns.result(),
+                                **self.fund_composition.to_arrays()})
+        except Exception as error:
+            self.error = error
+        finally:
+            forget_job(self)
+
+
+# FUNC: Returns a running job for the parameters, subscribing to the job another
+# session already started for the same seeded parameters if there is one
+def shared_job(params, workers=1):
+    if params[6] is None:
+        return SimulationJob(*params, workers=workers).start()
+
+    key = composition_key(*params)
+    with _running_jobs_lock:
+        job = _running_jobs.get(key)
+        if job is not None and job.subscribe() is not None:
+            count("coalesced_jobs")
+            return job
+        job = _running_jobs[key] = SimulationJob(*params, workers=workers).start()
+        return job
+
+
+# FUNC: Removes a finished or cancelled job from the shared running jobs
+def forget_job(job):
+    if job.params[6] is None:
+        return
+    with _running_jobs_lock:
+        key = composition_key(*job.params)
+        if _running_jobs.get(key) is job:
+            del _running_jobs[key]
+
+
+# FUNC: Returns the job for the given simulation parameters from a dict-like
+# store (e.g. st.session_state), releasing and replacing the stored job if it
+# was started for different parameters
+def current_job(store, prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs, seed=None, sampling="random", workers=1, key="simulation_job"):
+    params = (prob_dist, liquidation_pct, average_yoy_growth, average_exit_time,
+              portfolio_size, simulation_runs, seed, sampling)
+    job = store.get(key)
+    if job is not None and job.params == params and not job.cancelled:
+        return job
+    if job is not None:
+        job.release()
+    job = shared_job(params, workers)
+    store[key] = job
+    return job
+
+
+# FUNC: Releases and forgets the job kept in a dict-like store, if there is one
+def cancel_job(store, key="simulation_job"):
+    job = store.get(key)
+    if job is not None:
+        job.release()
+        del store[key]
@@ -1,6 +1,12 @@
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import numpy as np
-import pandas as pd
-import powerlaw
+
+from fees import net_fund_multiples
+from instrumentation import count, timed
+from pareto import power_law_inverse_cdf
 
 # FUNC: Given a average YoY growth rate and exit time, calculates the
 # corresponding alpha parameter for the power law distribution
@@ -26,87 +32,346 @@ def simulate_single_draw(alpha, liquidation_pct, prob_dist):
     elif draw == "LIQUIDATION":
         return liquidation_pct
     else:
-        dist = powerlaw.Power_Law(xmin=1, parameters=[alpha])
-        return dist.generate_random(1)[0]
+        return float(power_law_inverse_cdf(np.random.random_sample(), alpha))
+
+
+# Outcome codes used by the vectorized engine; the order matches the order of
+# the probabilities in prob_dist
+OUTCOME_ZERO = 0
+OUTCOME_LIQUIDATION = 1
+OUTCOME_MULTIPLE = 2
+
+
+# FUNC: Ensures the probabilities sum to one by proportionally distributing
+# remainder across array
+def normalize_prob_dist(prob_dist):
+    prob_array = np.asarray(prob_dist, dtype=np.float64)
+    return prob_array / prob_array.sum()
+
+
+# FUNC: Maps an array of uniforms on [0, 1) to outcome codes, so that a whole
+# matrix of weighted, categorical draws is made in one go
+def draw_outcome_codes(prob_dist, uniforms):
+    cumulative = np.cumsum(normalize_prob_dist(prob_dist))
+    return np.searchsorted(cumulative[:-1], uniforms, side="right").astype(np.uint8)
+
+
+# FUNC: Converts a matrix of outcome codes into return multiples, using the
+# matching entries of multiple_uniforms for the "MULTIPLE" outcomes
+def map_draws_to_outcomes(codes, multiple_uniforms, alpha, liquidation_pct):
+    outcomes = np.zeros(codes.shape, dtype=np.float64)
+    outcomes[codes == OUTCOME_LIQUIDATION] = liquidation_pct
+    is_multiple = codes == OUTCOME_MULTIPLE
+    outcomes[is_multiple] = power_law_inverse_cdf(multiple_uniforms[is_multiple], alpha)
+    return outcomes
+
+
+# Number of funds drawn from each independent random stream. Chunk boundaries
+# only depend on this value, so a seeded run gives the same funds regardless of
+# how (or where) the chunks end up being computed
+DEFAULT_CHUNK_SIZE = 1000
+
+
+# FUNC: Converts a seed (None, an int, a SeedSequence or a Generator) into a
+# SeedSequence from which the per-chunk streams are spawned
+def as_seed_sequence(seed=None):
+    if isinstance(seed, np.random.SeedSequence):
+        # Copy so that spawning does not advance the caller's sequence
+        return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key)
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(int(seed.integers(0, 2**63)))
+    return np.random.SeedSequence(seed)
+
+
+# FUNC: Splits simulation_runs into chunks of at most chunk_size funds, each
+# paired with its own child stream (start, stop, SeedSequence)
+def plan_chunks(simulation_runs, seed=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    simulation_runs = int(simulation_runs)
+    starts = list(range(0, simulation_runs, int(chunk_size)))
+    children = as_seed_sequence(seed).spawn(len(starts))
+    return [(start, min(start + int(chunk_size), simulation_runs), child)
+            for start, child in zip(starts, children)]
+
 
+# Ways of drawing the uniforms behind a chunk of funds. "random" draws plain
+# pseudo-random numbers; the others are variance-reduction schemes:
+#   antithetic: the second half of the funds mirrors the first (u -> 1 - u)
+#   stratified: Latin hypercube sampling across the funds of a chunk. For each
+#       company slot, every 1/chunk_runs stratum of [0, 1) is drawn by exactly
+#       one fund, so each outcome is allocated in its expected proportion
+#       while every single fund keeps independent uniform draws
+#   sobol, halton: scrambled quasi-Monte Carlo points in 2 * portfolio_size
+#       dimensions, one point per fund, re-scrambled for each chunk
+SAMPLING_METHODS = ["random", "antithetic", "stratified", "sobol", "halton"]
 
-# FUNC: Simulates several venture funds with a set portfolio size each using the
-# simulate_single_draw function
-def simulate_multiple_funds(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500):
+# Largest double below 1.0, keeping mirrored uniforms on [0, 1)
+_BELOW_ONE = np.nextafter(1.0, 0.0)
+
+
+# FUNC: Mirrors the first half of a (funds x portfolio_size) uniform draw into
+# the second half, pairing each fund with its antithetic twin
+def antithetic_uniforms(rng, shape):
+    half = rng.random(((shape[0] + 1) // 2, shape[1]))
+    return np.concatenate([half, np.minimum(1.0 - half, _BELOW_ONE)])[:shape[0]]
+
+
+# FUNC: Draws a Latin hypercube: every company slot gets one value in each of
+# the chunk_runs strata of [0, 1), shuffled across the funds
+def stratified_uniforms(rng, shape):
+    strata = rng.permuted(np.broadcast_to(np.arange(shape[0])[:, np.newaxis], shape), axis=0)
+    return (strata + rng.random(shape)) / shape[0]
+
+
+# FUNC: Draws one scrambled Sobol or Halton point per fund, split into the
+# outcome and multiple uniforms. scipy is imported only for these methods
+def qmc_uniforms(rng, shape, method):
+    from scipy.stats import qmc
+
+    engine_class = qmc.Sobol if method == "sobol" else qmc.Halton
+    try:
+        engine = engine_class(2 * shape[1], scramble=True, rng=rng)
+    except TypeError:
+        # scipy < 1.15 names the argument seed
+        engine = engine_class(2 * shape[1], scramble=True, seed=rng)
+    with warnings.catch_warnings():
+        # Sobol warns when the number of points is not a power of two
+        warnings.simplefilter("ignore", UserWarning)
+        points = engine.random(shape[0])
+    return points[:, :shape[1]], points[:, shape[1]:]
+
+
+# FUNC: Draws the uniforms behind one chunk of funds from its own random stream.
+# The first array picks the outcome of every company, the second one is fed
+# through the power law's inverse CDF for the "MULTIPLE" outcomes
+def draw_chunk_uniforms(chunk_runs, portfolio_size, seed_seq, sampling="random"):
+    rng = np.random.default_rng(seed_seq)
+    shape = (int(chunk_runs), int(portfolio_size))
+    if sampling == "random":
+        return rng.random(shape), rng.random(shape)
+    if sampling == "antithetic":
+        return antithetic_uniforms(rng, shape), antithetic_uniforms(rng, shape)
+    if sampling == "stratified":
+        return stratified_uniforms(rng, shape), stratified_uniforms(rng, shape)
+    if sampling in ("sobol", "halton"):
+        return qmc_uniforms(rng, shape, sampling)
+    raise ValueError("Unknown sampling method {!r}, expected one of {}".format(
+        sampling, ", ".join(SAMPLING_METHODS)))
+
+
+# FUNC: Simulates one chunk of funds from its own random stream, returning both
+# the outcome codes and the return multiples
+@timed("library.simulate_chunk")
+def simulate_chunk_with_codes(prob_dist, liquidation_pct, alpha, portfolio_size, chunk_runs, seed_seq, sampling="random"):
+    outcome_uniforms, multiple_uniforms = draw_chunk_uniforms(chunk_runs, portfolio_size,
+                                                              seed_seq, sampling)
+    codes = draw_outcome_codes(prob_dist, outcome_uniforms)
+    outcomes = map_draws_to_outcomes(codes, multiple_uniforms, alpha, liquidation_pct)
+    count("draws", outcome_uniforms.size + multiple_uniforms.size)
+    count("funds", int(chunk_runs))
+    count("bytes_allocated", outcome_uniforms.nbytes + multiple_uniforms.nbytes
+          + codes.nbytes + outcomes.nbytes)
+    return codes, outcomes
+
+
+# FUNC: Simulates one chunk of funds from its own random stream
+def simulate_chunk(prob_dist, liquidation_pct, alpha, portfolio_size, chunk_runs, seed_seq, sampling="random"):
+    return simulate_chunk_with_codes(prob_dist, liquidation_pct, alpha, portfolio_size,
+                                     chunk_runs, seed_seq, sampling)[1]
+
+
+# FUNC: Simulates several venture funds with a set portfolio size each, drawing
+# the whole (simulation_runs x portfolio_size) matrix of company outcomes
+@timed("library.simulate_fund_matrix")
+def simulate_fund_matrix(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, sampling="random"):
     # Calculate the appropriate alpha given the inputs
     alpha = calculate_alpha(average_yoy_growth, average_exit_time)
 
-    # Simuate i=simulation_runs of funds with a n=portfolio_size portfolio size
-    simulated_funds_list = [[simulate_single_draw(alpha, liquidation_pct, prob_dist) for i in range(portfolio_size)] for j in range(int(simulation_runs))]
+    simulated_funds = np.empty((int(simulation_runs), int(portfolio_size)), dtype=np.float64)
+    for start, stop, seed_seq in plan_chunks(simulation_runs, seed, chunk_size):
+        simulated_funds[start:stop] = simulate_chunk(prob_dist, liquidation_pct, alpha,
+                                                     portfolio_size, stop - start, seed_seq,
+                                                     sampling)
+    return simulated_funds
+
 
-    return simulated_funds_list
+# FUNC: Iterates over a matrix of company outcomes as float64 chunks of funds.
+# Containers with an iter_chunks method (such as results.SimulationResult) are
+# read chunk by chunk, anything else is converted as a single chunk
+def iter_outcome_chunks(simulated_funds):
+    if hasattr(simulated_funds, "iter_chunks"):
+        return simulated_funds.iter_chunks()
+    return [np.asarray(simulated_funds, dtype=np.float64)]
+
+
+# FUNC: Reduces a (funds x portfolio_size) matrix of company outcomes to the raw
+# return multiple of each fund
+@timed("library.fund_raw_returns")
+def fund_raw_returns(simulated_funds):
+    return np.concatenate([chunk.sum(axis=1) / chunk.shape[1]
+                           for chunk in iter_outcome_chunks(simulated_funds)])
+
+
+# FUNC: Simulates one chunk of funds and reduces it in place, so that only one
+# float per fund (rather than the company matrix) leaves a worker process
+def simulate_chunk_returns(prob_dist, liquidation_pct, alpha, portfolio_size, chunk, sampling="random"):
+    start, stop, seed_seq = chunk
+    return fund_raw_returns(simulate_chunk(prob_dist, liquidation_pct, alpha,
+                                           portfolio_size, stop - start, seed_seq, sampling))
+
+
+# FUNC: Simulates several venture funds and returns only the raw return of each
+# fund as an ndarray. With workers > 1 the chunks are sharded across a process
+# pool; the result is identical to a single-process run with the same seed
+@timed("library.simulate_fund_returns")
+def simulate_fund_returns(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=1, sampling="random"):
+    alpha = calculate_alpha(average_yoy_growth, average_exit_time)
+    chunks = plan_chunks(simulation_runs, seed, chunk_size)
+    simulate = partial(simulate_chunk_returns, prob_dist, liquidation_pct, alpha,
+                       int(portfolio_size), sampling=sampling)
+
+    if workers is None or workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_returns = list(executor.map(simulate, chunks))
+    else:
+        chunk_returns = [simulate(chunk) for chunk in chunks]
+
+    if not chunk_returns:
+        return np.empty(0, dtype=np.float64)
+    return np.concatenate(chunk_returns)
+
+
+# FUNC: Generator that simulates several venture funds one chunk at a time,
+# yielding (chunk_size x portfolio_size) matrices so callers can fold and
+# discard each chunk instead of holding every company outcome in memory
+def iter_fund_chunks(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, sampling="random"):
+    alpha = calculate_alpha(average_yoy_growth, average_exit_time)
+    for start, stop, seed_seq in plan_chunks(simulation_runs, seed, chunk_size):
+        yield simulate_chunk(prob_dist, liquidation_pct, alpha, portfolio_size,
+                             stop - start, seed_seq, sampling)
+
+
+# FUNC: Simulates several venture funds with a set portfolio size each. Kept for
+# callers that expect a list of lists; see simulate_fund_matrix
+def simulate_multiple_funds(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, sampling="random"):
+    return simulate_fund_matrix(prob_dist, liquidation_pct, average_yoy_growth,
+                                average_exit_time, portfolio_size,
+                                simulation_runs, seed, chunk_size, sampling).tolist()
+
+
+# Return multiple thresholds used to sort funds into performance buckets and
+# portfolio companies into return bins
+FUND_BUCKETS = ['failure', 'breakeven', 'moderate_success', 'winner']
+FUND_BUCKET_EDGES = [1, 2, 3]
+COMPANY_BINS = ['less_1x', '1x_2x', '2x_3x', '3x_10x', 'greateq_10x']
+COMPANY_BIN_EDGES = [1, 2, 3, 10]
+
+
+# FUNC: Sorts fund return multiples into the index of their performance bucket
+def fund_bucket_indices(returns_list):
+    return np.digitize(returns_list, FUND_BUCKET_EDGES)
+
+
+# FUNC: Counts the companies in each return bin of every fund and sums their
+# returns, in one pass over the (funds x portfolio_size) matrix
+@timed("library.company_bin_summary")
+def company_bin_summary(simulated_funds):
+    n_bins = len(COMPANY_BINS)
+    counts, sums = [], []
+    for chunk in iter_outcome_chunks(simulated_funds):
+        runs = chunk.shape[0]
+
+        # Offset each fund's bin index so one bincount covers every (fund, bin) pair
+        flat_bins = (np.digitize(chunk, COMPANY_BIN_EDGES)
+                     + n_bins * np.arange(runs)[:, np.newaxis]).ravel()
+        counts.append(np.bincount(flat_bins, minlength=runs * n_bins).reshape(runs, n_bins))
+        sums.append(np.bincount(flat_bins, weights=chunk.ravel(),
+                                minlength=runs * n_bins).reshape(runs, n_bins))
+    return np.concatenate(counts), np.concatenate(sums)
 
 
 def calculate_raw_fund_returns(simulation_data):
-    raw_returns_list = []
-    for fund in simulation_data:
-        fund_array = np.array(fund)
-        raw_fund_return = fund_array.sum() / len(fund_array)
-        raw_returns_list.append(raw_fund_return)
-    return raw_returns_list
+    return fund_raw_returns(simulation_data).tolist()
+
+
+# FUNC: Calculates the LPs' net return multiples after management fees and
+# carried interest; see fees.py for the waterfall. Without carry this is the
+# raw return scaled by the share of capital left over after management fees
+@timed("library.calculate_actual_fund_returns")
+def calculate_actual_fund_returns(raw_returns_list, mgmt_pct_fee, fund_lifespan, carry_pct=0.0, hurdle_rate=0.0, catch_up_pct=1.0):
+    actual_returns = net_fund_multiples(raw_returns_list, mgmt_pct_fee, fund_lifespan,
+                                        carry_pct, hurdle_rate, catch_up_pct)
+    if isinstance(raw_returns_list, list):
+        return actual_returns.tolist()
+    return actual_returns
 
 
-def calculate_actual_fund_returns(raw_returns_list, mgmt_pct_fee, fund_lifespan):
-    # Calculate what percentage of committed capital is leftover for actual investment
-    pct_capital_investment = 1.0 - (mgmt_pct_fee * fund_lifespan)
+# FUNC: Calculates, for every fund, the share of its companies and the share of
+# its returns that falls into each company return bin
+def company_bin_shares(simulated_funds, portfolio_size=None):
+    counts, sums = company_bin_summary(simulated_funds)
+    if portfolio_size is None:
+        portfolio_size = np.shape(simulated_funds)[1]
 
-    return(list(map(lambda x: x * pct_capital_investment, raw_returns_list)))
+    # Funds that returned nothing get 0% from every company bin
+    totals = sums.sum(axis=1, keepdims=True)
+    pct_return = np.divide(sums, totals, out=np.zeros_like(sums), where=totals != 0)
+    return counts / portfolio_size, pct_return
 
 
+# FUNC: Analyzes every fund in one vectorized pass, returning a DataFrame with
+# one row per fund: its bucket plus the pct_comp_* and pct_return_* columns,
+# and a weight column for weighted (e.g. importance-sampled) funds
+@timed("library.analyze_fund_frame")
+def analyze_fund_frame(simulation_data, raw_returns_list=None, portfolio_size=None, weights=None):
+    import pandas as pd
+
+    if raw_returns_list is None:
+        raw_returns_list = fund_raw_returns(simulation_data)
+    pct_comp, pct_return = company_bin_shares(simulation_data, portfolio_size)
+
+    fund_analysis = pd.DataFrame({
+        "bucket": pd.Categorical.from_codes(fund_bucket_indices(raw_returns_list),
+                                            categories=FUND_BUCKETS)})
+    for i, company_bin in enumerate(COMPANY_BINS):
+        fund_analysis["pct_comp_" + company_bin] = pct_comp[:, i]
+    for i, company_bin in enumerate(COMPANY_BINS):
+        fund_analysis["pct_return_" + company_bin] = pct_return[:, i]
+    if weights is not None:
+        fund_analysis["weight"] = np.asarray(weights, dtype=np.float64)
+    return fund_analysis
+
+
+# FUNC: Analyzes every fund, returning one dict per fund. Kept for callers that
+# expect a list of dicts; see analyze_fund_frame
 def analyze_fund_returns(simulation_data, raw_returns_list, portfolio_size):
-   # Determine the bucket this fund gets sorted into
-   fund_analysis_list = []
-   for i in range(0, len(raw_returns_list)):
-       if (raw_returns_list[i] < 1):
-           fund_analysis_list.append({"bucket": "failure"})
-       elif (raw_returns_list[i] >=1) and (raw_returns_list[i] < 2):
-           fund_analysis_list.append({"bucket": "breakeven"})
-       elif (raw_returns_list[i] >=2) and (raw_returns_list[i] < 3):
-           fund_analysis_list.append({"bucket": "moderate_success"})
-       else:
-           fund_analysis_list.append({"bucket": "winner"})
-
-   # Calculate the composition of each fund's portfolio companies
-   for i in range(0, len(simulation_data)):
-       fund_analysis_list[i]["pct_comp_less_1x"] =  len([x for x in simulation_data[i] if x < 1]) / portfolio_size
-       fund_analysis_list[i]["pct_comp_1x_2x"] =  len([x for x in simulation_data[i] if (x >= 1) and (x < 2)]) / portfolio_size
-       fund_analysis_list[i]["pct_comp_2x_3x"] =  len([x for x in simulation_data[i] if (x >= 2) and (x < 3)]) / portfolio_size
-       fund_analysis_list[i]["pct_comp_3x_10x"] =  len([x for x in simulation_data[i] if (x >= 3) and (x < 10)]) / portfolio_size
-       fund_analysis_list[i]["pct_comp_greateq_10x"] =  len([x for x in simulation_data[i] if x >= 10]) / portfolio_size
-
-   # Calculate the composition of each fund's returns
-   for i in range(0, len(simulation_data)):
-       if (raw_returns_list[i] == 0):
-          fund_analysis_list[i]["pct_return_less_1x"] = 0.0
-          fund_analysis_list[i]["pct_return_1x_2x"] = 0.0
-          fund_analysis_list[i]["pct_return_2x_3x"] = 0.0
-          fund_analysis_list[i]["pct_return_3x_10x"] = 0.0
-          fund_analysis_list[i]["pct_return_greateq_10x"] = 0.0
-       else:
-          fund_analysis_list[i]["pct_return_less_1x"] = np.sum([x for x in simulation_data[i] if x < 1]) / np.sum(simulation_data[i])
-          fund_analysis_list[i]["pct_return_1x_2x"] = np.sum([x for x in simulation_data[i] if (x >= 1) and (x < 2)]) / np.sum(simulation_data[i])
-          fund_analysis_list[i]["pct_return_2x_3x"] = np.sum([x for x in simulation_data[i] if (x >= 2) and (x < 3)]) / np.sum(simulation_data[i])
-          fund_analysis_list[i]["pct_return_3x_10x"] = np.sum([x for x in simulation_data[i] if (x >= 3) and (x < 10)]) / np.sum(simulation_data[i])
-          fund_analysis_list[i]["pct_return_greateq_10x"] = np.sum([x for x in simulation_data[i] if x >= 10]) / np.sum(simulation_data[i])
-
-   return fund_analysis_list
+    fund_analysis = analyze_fund_frame(simulation_data, raw_returns_list, portfolio_size)
+    fund_analysis["bucket"] = fund_analysis["bucket"].astype(str)
+    return fund_analysis.to_dict("records")
+
+
+# FUNC: Averages every analysis variable within each bucket using one grouped
+# reduction, weighted by the weight column if there is one. Rows are the
+# buckets in FUND_BUCKETS order, empty buckets are 0.0
+@timed("library.get_bucket_averages")
+def get_bucket_averages(fund_analysis):
+    import pandas as pd
+
+    if not isinstance(fund_analysis, pd.DataFrame):
+        fund_analysis = pd.DataFrame(list(fund_analysis))
+    if "weight" not in fund_analysis.columns:
+        return (fund_analysis.groupby("bucket", observed=False).mean()
+                .reindex(FUND_BUCKETS).fillna(0.0))
+
+    weights = fund_analysis["weight"]
+    weighted_sums = (fund_analysis.drop(columns=["bucket", "weight"]).mul(weights, axis=0)
+                     .groupby(fund_analysis["bucket"], observed=False).sum())
+    weight_totals = weights.groupby(fund_analysis["bucket"], observed=False).sum()
+    return (weighted_sums.div(weight_totals, axis=0)
+            .reindex(FUND_BUCKETS).fillna(0.0))
 
 
 def get_averages_for_variable_across_buckets(fund_analysis_list, var):
-    bucket_list = ['failure', 'breakeven', 'moderate_success', 'winner']
-    results = []
-    for bucket in bucket_list:
-        result = np.average([x[var] for x in fund_analysis_list if x['bucket'] == bucket])
-        if np.isnan(result):
-            results.append(0.0)
-        else:
-            results.append(result)
-    return np.array(results)
+    return get_bucket_averages(fund_analysis_list)[var].to_numpy()
 
 
 def convert_moic_to_cagr(moic, fund_lifespan):
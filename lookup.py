@@ -0,0 +1,162 @@
+"""
+Precomputed table of fund-return quantiles for instant previews.
+
+The table holds the raw fund-return quantiles of a Monte Carlo run for every
+point of a grid over (alpha, % zero, % liquidation, liquidation %, portfolio
+size); the % of "MULTIPLE" outcomes is whatever remains. It is saved as a
+directory with a memory-mapped quantiles.npy and the grid axes in axes.npz,
+and QuantileTable interpolates between grid points.
+
+Build a table offline with:
+    python lookup.py build lookup_table --runs 2000 --workers 8
+"""
+
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+import numpy as np
+
+from library import normalize_prob_dist
+from quantiles import compute_quantiles
+from sweep import sweep_alphas
+
+QUANTILES = (0.25, 0.50, 0.75, 0.90, 0.99)
+
+DEFAULT_AXES = {
+    "alpha": np.round(np.geomspace(1.05, 4.0, 24), 4),
+    "p_zero": np.round(np.linspace(0.0, 1.0, 11), 4),
+    "p_liquidation": np.round(np.linspace(0.0, 1.0, 11), 4),
+    "liquidation_pct": np.array([0.01, 0.25, 0.5, 0.75, 1.0]),
+    "portfolio_size": np.array([1, 5, 10, 20, 50, 100, 200, 500, 1000]),
+}
+AXIS_NAMES = list(DEFAULT_AXES)
+
+# Portfolio sizes are interpolated on a log scale, since quantiles change much
+# faster between 1 and 10 companies than between 500 and 1000
+LOG_AXES = {"portfolio_size"}
+
+
+# FUNC: Simulates one (p_zero, p_liquidation, liquidation_pct, portfolio_size)
+# cell of the grid for every alpha at once, returning (alphas x quantiles)
+def simulate_table_cell(alphas, simulation_runs, seed, cell):
+    p_zero, p_liquidation, liquidation_pct, portfolio_size = cell
+    p_multiple = 1.0 - p_zero - p_liquidation
+    if p_multiple < -1e-9:
+        return np.full((len(alphas), len(QUANTILES)), np.nan)
+
+    raw_returns = sweep_alphas([p_zero, p_liquidation, max(p_multiple, 0.0)],
+                               liquidation_pct, alphas, int(portfolio_size),
+                               simulation_runs, seed)
+    return compute_quantiles(raw_returns, QUANTILES)
+
+
+# FUNC: Fills the quantile table for the given axes, optionally sharding the
+# grid cells across a process pool, and saves it to the path directory
+def build_quantile_table(path, axes=None, simulation_runs=2000, seed=2022, workers=1):
+    axes = {name: np.asarray(values, dtype=np.float64)
+            for name, values in (axes or DEFAULT_AXES).items()}
+    cells = list(itertools.product(axes["p_zero"], axes["p_liquidation"],
+                                   axes["liquidation_pct"], axes["portfolio_size"]))
+    simulate = partial(simulate_table_cell, axes["alpha"], simulation_runs, seed)
+
+    if workers is None or workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            cell_quantiles = list(executor.map(simulate, cells, chunksize=8))
+    else:
+        cell_quantiles = [simulate(cell) for cell in cells]
+
+    # Cells come back as (alpha x quantiles); move alpha to the first axis
+    shape = [len(axes[name]) for name in AXIS_NAMES[1:]]
+    table = np.stack(cell_quantiles).reshape(*shape, len(axes["alpha"]), len(QUANTILES))
+    table = np.moveaxis(table, -2, 0).astype(np.float32)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "quantiles.npy"), table)
+    np.savez(os.path.join(path, "axes.npz"), quantiles=np.array(QUANTILES),
+             simulation_runs=simulation_runs, **axes)
+    return QuantileTable.load(path)
+
+
+class QuantileTable:
+    """Interpolating lookup over a precomputed, memory-mapped quantile table."""
+
+    def __init__(self, table, axes, quantiles):
+        self.table = table
+        self.axes = axes
+        self.quantiles = quantiles
+
+    @classmethod
+    def load(cls, path):
+        table = np.load(os.path.join(path, "quantiles.npy"), mmap_mode="r")
+        with np.load(os.path.join(path, "axes.npz")) as npz:
+            axes = {name: npz[name] for name in AXIS_NAMES}
+            quantiles = tuple(npz["quantiles"])
+        return cls(table, axes, quantiles)
+
+    def lookup(self, alpha, prob_dist, liquidation_pct, portfolio_size):
+        """Returns the interpolated raw fund-return multiple at each of
+        self.quantiles. Points outside the grid are clamped to its edges."""
+        p_zero, p_liquidation, _ = normalize_prob_dist(prob_dist)
+        point = {"alpha": alpha, "p_zero": p_zero, "p_liquidation": p_liquidation,
+                 "liquidation_pct": liquidation_pct, "portfolio_size": portfolio_size}
+
+        # Lower grid index and interpolation weight along every axis
+        lower, weights = [], []
+        for name in AXIS_NAMES:
+            axis, value = self.axes[name], float(point[name])
+            if name in LOG_AXES:
+                axis, value = np.log(axis), np.log(max(value, 1e-12))
+            i = int(np.clip(np.searchsorted(axis, value, side="right") - 1, 0, len(axis) - 2))
+            lower.append(i)
+            weights.append(float(np.clip((value - axis[i]) / (axis[i + 1] - axis[i]), 0.0, 1.0)))
+
+        # Multilinear interpolation in log1p space over the 2^5 surrounding
+        # grid points, skipping those with an impossible probability split
+        total, total_weight = np.zeros(len(self.quantiles)), 0.0
+        for corner in itertools.product((0, 1), repeat=len(AXIS_NAMES)):
+            weight = np.prod([w if c else 1.0 - w for c, w in zip(corner, weights)])
+            if weight == 0.0:
+                continue
+            values = np.asarray(self.table[tuple(i + c for i, c in zip(lower, corner))],
+                                dtype=np.float64)
+            if np.isnan(values).any():
+                continue
+            total += weight * np.log1p(values)
+            total_weight += weight
+
+        if total_weight == 0.0:
+            return np.full(len(self.quantiles), np.nan)
+        return np.expm1(total / total_weight)
+
+
+# FUNC: Loads the table pointed at by the VC_SIM_LOOKUP_TABLE environment
+# variable once per process, or returns None if no table has been built
+@lru_cache(maxsize=None)
+def load_default_table():
+    path = os.environ.get("VC_SIM_LOOKUP_TABLE", "lookup_table")
+    if not os.path.exists(os.path.join(path, "quantiles.npy")):
+        return None
+    return QuantileTable.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the fund-return quantile lookup table.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="simulate every grid point and save the table")
+    build.add_argument("path", help="directory to write quantiles.npy and axes.npz to")
+    build.add_argument("--runs", type=int, default=2000, help="funds simulated per grid point")
+    build.add_argument("--seed", type=int, default=2022)
+    build.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        table = build_quantile_table(args.path, simulation_runs=args.runs, seed=args.seed,
+                                     workers=args.workers)
+        print("Saved a {} table to {}".format("x".join(map(str, table.table.shape)), args.path))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,10 @@ through an object oriented framework.
 """
 
 # Import necessary libraries
+import importlib
+
 import streamlit as st
+import instrumentation
 
 # Define the multipage class to manage the multiple apps in our program
 class MultiPage:
@@ -19,7 +22,9 @@ class MultiPage:
         Args:
             title ([str]): The title of page which we are adding to the list of apps
 
-            func: Python function to render this page in Streamlit
+            func: Python function to render this page in Streamlit, or the
+                module path of a page (e.g. "pages.simulator") whose app
+                function is imported only once the page is selected
         """
 
         self.pages.append({
@@ -36,5 +41,54 @@ class MultiPage:
             format_func=lambda page: page['title']
         )
 
-        # run the app function
-        page['function']()
+        # Optionally record how long each stage of the page takes. Recording
+        # is process-wide, so it is only switched when a session changes its
+        # checkbox, rather than reset by every session on every rerun. The
+        # panel is laid out before the page runs and filled in after it
+        with st.sidebar.expander("Debug timings"):
+            record_timings = st.checkbox("Record timings", value=instrumentation.is_enabled(),
+                                         key="record_timings",
+                                         on_change=self.toggle_timings)
+            timings_panel = st.empty()
+
+        # run the app function, importing the page's module on first use
+        func = page['function']
+        if isinstance(func, str):
+            with instrumentation.timed("multipage.import_page"):
+                func = importlib.import_module(func).app
+        func()
+
+        if record_timings:
+            self.show_timings(timings_panel)
+
+    def toggle_timings(self):
+        """Turns the process-wide recording on or off to match the checkbox."""
+        instrumentation.enable(st.session_state["record_timings"])
+
+    def show_timings(self, panel):
+        """Shows the recorded stage timings and counters, and the shared
+        cache's metrics, in the given placeholder, with JSON and Prometheus
+        exports."""
+        stats = instrumentation.snapshot()
+        stages = sorted(stats["timings"].items(), key=lambda item: -item[1]["total_seconds"])
+        with panel.container():
+            st.caption("Timings and counters cover every session in this server \
+            process, not just this one.")
+            st.dataframe({"stage": [name for name, _ in stages],
+                          "calls": [stage["calls"] for _, stage in stages],
+                          "total (s)": [stage["total_seconds"] for _, stage in stages],
+                          "max (s)": [stage["max_seconds"] for _, stage in stages]})
+            st.dataframe({"counter": list(stats["counters"]),
+                          "value": list(stats["counters"].values())})
+
+            # The simulation cache is shared by every session in this process
+            from cache import default_cache
+            cache_metrics = default_cache.metrics()
+            st.dataframe({"shared cache": list(cache_metrics),
+                          "value": list(cache_metrics.values())})
+            st.download_button("Download JSON", instrumentation.to_json(),
+                               file_name="timings.json")
+            st.download_button("Download Prometheus text", instrumentation.to_prometheus(),
+                               file_name="timings.prom")
+            if st.button("Reset timings"):
+                instrumentation.reset()
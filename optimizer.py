@@ -0,0 +1,170 @@
+"""
+Portfolio-construction optimizer.
+
+Searches over portfolio sizes, follow-on reserve ratios and outcome
+probabilities for the configuration that maximizes a target statistic of the
+net (after fee) fund returns. Candidates are raced with successive halving:
+every configuration starts with a few cheap chunks of funds, only the best
+1 / eta of them advance to the next round, and each round the survivors get
+eta times as many funds. Poor configurations are dropped early, and only the
+promising ones are simulated at full precision.
+
+All configurations draw from the same seed, so within a round they are
+compared on common random numbers, and a configuration that advances keeps
+its funds and only simulates the new chunks.
+
+Follow-on reserves: a reserve_ratio share of the investable capital is held
+back from the initial checks and later invested, pro rata, in the companies
+that went on to a "MULTIPLE" (>= 1x) outcome, at a price follow_on_step_up
+times higher than the initial check. Reserves of funds without any such company
+are returned at 1x. With reserve_ratio = 0 a fund's raw return is exactly the
+one simulate_multiple_funds and calculate_raw_fund_returns give.
+"""
+
+import itertools
+import math
+
+import numpy as np
+import pandas as pd
+
+from batch import normalize_scenario
+from library import (DEFAULT_CHUNK_SIZE, OUTCOME_MULTIPLE, as_seed_sequence,
+                     calculate_actual_fund_returns, calculate_alpha, plan_chunks,
+                     simulate_chunk_with_codes)
+
+# Parameters the optimizer adds on top of the batch scenario parameters
+DEFAULT_RESERVES = {"reserve_ratio": 0.0, "follow_on_step_up": 2.0}
+
+
+# FUNC: Statistics of the net fund returns that the optimizer can maximize
+def median_moic(actual_returns, fund_lifespan):
+    return float(np.median(actual_returns))
+
+
+def probability_3x(actual_returns, fund_lifespan):
+    return float(np.mean(actual_returns >= 3))
+
+
+def probability_beat_benchmark(actual_returns, fund_lifespan):
+    return float(np.mean(actual_returns > 1.10 ** fund_lifespan))
+
+
+OBJECTIVES = {"median_moic": median_moic,
+              "p_3x": probability_3x,
+              "p_beat_benchmark": probability_beat_benchmark}
+
+
+# FUNC: Computes the raw return multiple of every fund in a chunk when a share of
+# the capital is reserved for follow-ons into the "MULTIPLE" companies
+def fund_returns_with_reserves(outcomes, codes, reserve_ratio, follow_on_step_up):
+    initial = outcomes.mean(axis=1)
+    if reserve_ratio == 0:
+        return initial
+
+    is_multiple = codes == OUTCOME_MULTIPLE
+    followed = is_multiple.sum(axis=1)
+    follow_on_sums = np.where(is_multiple, outcomes, 0.0).sum(axis=1) / follow_on_step_up
+    follow_on = np.divide(follow_on_sums, followed, out=np.ones_like(initial),
+                          where=followed > 0)
+    return (1.0 - reserve_ratio) * initial + reserve_ratio * follow_on
+
+
+# FUNC: Builds the Cartesian product of the given search dimensions as a list
+# of configuration dicts, e.g. config_grid(portfolio_size=[20, 50],
+# reserve_ratio=[0.0, 0.5])
+def config_grid(**dimensions):
+    names = list(dimensions)
+    return [dict(zip(names, values)) for values in itertools.product(*dimensions.values())]
+
+
+class Candidate:
+    """One configuration being raced, with the raw returns simulated so far."""
+
+    def __init__(self, index, config, scenario):
+        self.index = index
+        self.config = config
+        self.scenario = scenario
+        self.alpha = calculate_alpha(scenario["average_yoy_growth"], scenario["average_exit_time"])
+        self.raw_returns = np.empty(0, dtype=np.float64)
+        self.score = -math.inf
+
+    @property
+    def runs(self):
+        return len(self.raw_returns)
+
+    def extend(self, runs, seed, chunk_size):
+        """Simulates the chunks needed to reach runs funds. The chunk streams
+        are a prefix of the same plan, so earlier funds are never redrawn."""
+        scenario = self.scenario
+        new_returns = [self.raw_returns]
+        for start, stop, seed_seq in plan_chunks(runs, seed, chunk_size)[self.runs // chunk_size:]:
+            codes, outcomes = simulate_chunk_with_codes(scenario["prob_dist"],
+                                                        scenario["liquidation_pct"], self.alpha,
+                                                        scenario["portfolio_size"], stop - start,
+                                                        seed_seq, scenario["sampling"])
+            new_returns.append(fund_returns_with_reserves(outcomes, codes,
+                                                          scenario["reserve_ratio"],
+                                                          scenario["follow_on_step_up"]))
+        self.raw_returns = np.concatenate(new_returns)
+
+    def evaluate(self, objective):
+        scenario = self.scenario
+        actual_returns = calculate_actual_fund_returns(self.raw_returns, scenario["mgmt_pct_fee"],
+                                                       scenario["fund_lifespan"],
+                                                       scenario["carry_pct"],
+                                                       scenario["hurdle_rate"],
+                                                       scenario["catch_up_pct"])
+        self.score = objective(actual_returns, scenario["fund_lifespan"])
+        return self.score
+
+
+# FUNC: Fills in a configuration from the base parameters, the batch defaults
+# and DEFAULT_RESERVES, validating the parameter names
+def resolve_config(config, base=None):
+    merged = {**DEFAULT_RESERVES, **(base or {}), **config}
+    reserves = {key: merged.pop(key) for key in DEFAULT_RESERVES}
+    if not 0.0 <= reserves["reserve_ratio"] < 1.0:
+        raise ValueError("reserve_ratio must be in [0, 1), got {}".format(reserves["reserve_ratio"]))
+    return {**normalize_scenario(merged), **reserves}
+
+
+# FUNC: Races the configurations with successive halving and returns the best
+# configuration plus a DataFrame with one row per (round, configuration).
+# budget_runs is the approximate total number of funds simulated across all
+# configurations and rounds; each round keeps the best 1 / eta configurations
+# and gives them eta times as many funds
+def optimize_portfolio(configs, objective="median_moic", base=None, budget_runs=200000, eta=3, seed=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    if isinstance(objective, str):
+        objective = OBJECTIVES[objective]
+    if not configs:
+        raise ValueError("configs must contain at least one configuration")
+    # Fix the entropy once so every candidate and round extends the same streams
+    seed = as_seed_sequence(seed)
+
+    candidates = [Candidate(i, config, resolve_config(config, base))
+                  for i, config in enumerate(configs)]
+    rounds = max(int(math.ceil(math.log(len(candidates), eta))), 0) + 1
+
+    # Every round costs about len(configs) * first_runs funds in total; keep
+    # the run counts multiples of the chunk size so rounds extend whole chunks
+    first_runs = budget_runs / (rounds * len(candidates))
+    chunk_size = int(min(chunk_size, max(first_runs, 1)))
+    runs = max(int(first_runs // chunk_size), 1) * chunk_size
+
+    history = []
+    survivors = candidates
+    for round_index in range(rounds):
+        for candidate in survivors:
+            candidate.extend(runs, seed, chunk_size)
+            candidate.evaluate(objective)
+            history.append({"round": round_index, "config": candidate.index,
+                            **candidate.config, "runs": candidate.runs,
+                            "score": candidate.score})
+        survivors = sorted(survivors, key=lambda candidate: -candidate.score)
+        if len(survivors) == 1:
+            break
+        survivors = survivors[:max(len(survivors) // eta, 1)]
+        runs *= eta
+
+    best = survivors[0]
+    return {**best.config, "score": best.score, "runs": best.runs}, pd.DataFrame(history)
@@ -1,7 +1,9 @@
 import streamlit as st
 from library import *
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as font_manager
+from cache import cached_growth_sweep, default_cache, growth_sweep_nbytes
+from sweep import summarize_net_sweep
+from instrumentation import timed
+from charts import multi_scatter_chart, render_png
 
 
 def app():
@@ -54,6 +56,10 @@ def app():
         help='The percentage of profits made on the principal investment that goes \
         to the venture capitalist for generating a positive return. This is commonly \
         called "carry" in the industry.')
+        input_hurdle_percent = st.number_input(label="% hurdle rate (preferred return)", min_value=0.0, max_value=100.0, step=1.0, value=0.0,
+        help="The annual return, compounded over the fund lifespan, that limited \
+        partners receive before any carried interest is paid. Once it is met, the \
+        venture capitalist catches up on their share of the profits.")
         input_fund_lifespan = st.number_input(label="Fund lifespan in years", min_value=1, max_value=100, step=1, value=10,
         help="The amount of years the venture fund is expected to exist before all \
         capital must be returned to its limited partners.")
@@ -63,6 +69,15 @@ def app():
         input_simulation_runs= st.number_input(label="# of funds to simulate", min_value=1, max_value=100000, step=1, value=1000,
         help="The total number of venture funds to simulate using the selected \
         paramters.")
+        input_seed = st.number_input(label="Random seed", min_value=0, max_value=2**31 - 1, step=1, value=2022,
+        help="The seed for the random draws. The same parameters and seed always \
+        produce the same simulated funds, and results are reused instead of being \
+        simulated again.")
+        input_sampling = st.selectbox(label="Sampling method", options=SAMPLING_METHODS,
+        help="How the random draws are spread out. 'random' draws independent funds. \
+        'antithetic' pairs every fund with a mirrored twin, 'stratified' spreads each \
+        company's draws evenly across the funds, and 'sobol' and 'halton' use \
+        quasi-random sequences. Every growth rate shares the same draws either way.")
 
 
     # SECTION: ERRORS, WARNINGS, AND INFO INDICATORS
@@ -93,40 +108,33 @@ def app():
     growth_rates_list = list(range(input_average_yoy_growth_start,
                                    input_average_yoy_growth_end + 1))
 
-    growth_rates_dict = {}
+    # Every growth rate is simulated over the same draws, so the whole sweep
+    # costs one simulation plus a cheap transform per growth rate
+    if growth_sweep_nbytes(len(growth_rates_list), input_simulation_runs) > default_cache.max_bytes:
+        st.warning("This many growth rates and fund simulations are too large to \
+        cache, so every change (including fee changes) re-runs the whole sweep. \
+        Narrow the growth rate range or run fewer simulations to avoid this.")
+    raw_returns_sweep = cached_growth_sweep([input_prob_dist_zero / 100.0,
+                                             input_prob_dist_liquidation / 100.0,
+                                             input_prob_dist_multiple / 100.0],
+                                            input_liquidation_pct / 100.0,
+                                            [growth_rate / 100.0 for growth_rate in growth_rates_list],
+                                            input_average_exit_time,
+                                            input_portfolio_size,
+                                            input_simulation_runs,
+                                            input_seed,
+                                            input_sampling)
+    # Fees are applied and summarized a block of growth rates at a time, so the
+    # net returns of the whole sweep are never held at once
+    actual_averages, actual_quantiles = summarize_net_sweep(
+        raw_returns_sweep, {"mgmt_pct_fee": input_management_fee_percent / 100.0,
+                            "fund_lifespan": input_fund_lifespan,
+                            "carry_pct": input_carry_percent / 100.0,
+                            "hurdle_rate": input_hurdle_percent / 100.0})
 
-    for growth_rate in growth_rates_list:
-        sim_data = simulate_multiple_funds([input_prob_dist_zero / 100.0,
-                                            input_prob_dist_liquidation / 100.0,
-                                            input_prob_dist_multiple / 100.0],
-                                        input_liquidation_pct / 100.0,
-                                        growth_rate / 100.0,
-                                        input_average_exit_time,
-                                        input_portfolio_size,
-                                        input_simulation_runs)
-        raw_returns_list = calculate_raw_fund_returns(sim_data)
-        actual_returns_list = calculate_actual_fund_returns(raw_returns_list,
-                                                            input_management_fee_percent
-                                                            / 100.0,
-                                                            input_fund_lifespan)
-
-        actual_quantile_25 = np.quantile(actual_returns_list, q=0.25)
-        actual_quantile_50 = np.quantile(actual_returns_list, q=0.50)
-        actual_quantile_75 = np.quantile(actual_returns_list, q=0.75)
-        actual_quantile_90 = np.quantile(actual_returns_list, q=0.90)
-        actual_quantile_99 = np.quantile(actual_returns_list, q=0.99)
-        growth_rates_dict[str(growth_rate)] = (np.average(actual_returns_list),
-                                               actual_quantile_25,
-                                               actual_quantile_50,
-                                               actual_quantile_75,
-                                               actual_quantile_90,
-                                               actual_quantile_99)
-
-
-    # Configure necessary fonts for matplotlib
-    ssp_font_regular = font_manager.FontProperties(fname='./Source_Sans_Pro/SourceSansPro-Regular.ttf')
-    ssp_font_bold = font_manager.FontProperties(fname='./Source_Sans_Pro/SourceSansPro-Bold.ttf')
-    ssp_font_semibold = font_manager.FontProperties(fname='./Source_Sans_Pro/SourceSansPro-SemiBold.ttf')
+    growth_rates_dict = {}
+    for growth_rate, average, quantiles in zip(growth_rates_list, actual_averages, actual_quantiles):
+        growth_rates_dict[str(growth_rate)] = (average, *quantiles)
 
 
     # # SECTION: OVERVIEW OF SIMULATED FUND RETURNS
@@ -141,97 +149,28 @@ def app():
 
     stock_benchmark = (1.10) ** input_fund_lifespan
 
-    fig_average, ax_average = plt.subplots(figsize=(12, 4))
-    fig_average.patch.set_facecolor("#000000")
-    fig_average.patch.set_alpha(0)
-    ax_average.patch.set_facecolor("#000000")
-    ax_average.patch.set_alpha(0)
-    ax_average.scatter(x=list(map(int, growth_rates_dict.keys())), y=[x[0] for x in growth_rates_dict.values()])
-    plt.axhline(y=stock_benchmark, color='#ef4444', linestyle='dashed', linewidth=3)
-    ax_average.tick_params(color='white', labelcolor="white")
-    for spine in ax_average.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Scatterplot of Growth Rates vs. Average Return Multiples", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.xlabel("Average annual growth rate", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("Simulated fund return multiple", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.setp(ax_average.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_average.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_average)
-
-
-    fig_quartiles, ax_quartiles = plt.subplots(figsize=(12, 4))
-    fig_quartiles.patch.set_facecolor("#000000")
-    fig_quartiles.patch.set_alpha(0)
-    ax_quartiles.patch.set_facecolor("#000000")
-    ax_quartiles.patch.set_alpha(0)
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[1] for x in growth_rates_dict.values()],
-                         label="25th percentile", color="#ef4444")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[2] for x in growth_rates_dict.values()],
-                         label="50th percentile", color="#eab308")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[3] for x in growth_rates_dict.values()],
-                         label="75th percentile", color="#3b82f6")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[4] for x in growth_rates_dict.values()],
-                         label="90th percentile", color="#22c55e")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[5] for x in growth_rates_dict.values()],
-                         label="99th percentile", color="#166534")
-
-    plt.axhline(y=stock_benchmark, color='#ef4444', linestyle='dashed', linewidth=3)
-    ax_quartiles.tick_params(color='white', labelcolor="white")
-    for spine in ax_quartiles.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Scatterplot of Growth Rates vs. Return Multiples at Various Quartiles (0-1000x)", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.ylim(0,1000)
-    plt.xlabel("Annual growth rate", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("Simulated fund return multiple", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    ax_quartiles.legend(loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=5,
-            frameon=False)
-    plt.setp(ax_quartiles.get_legend().get_texts(), color='white', fontproperties=ssp_font_regular,
-            fontsize=12)
-    plt.setp(ax_quartiles.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_quartiles.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_quartiles)
-
-
-    fig_quartiles, ax_quartiles = plt.subplots(figsize=(12, 4))
-    fig_quartiles.patch.set_facecolor("#000000")
-    fig_quartiles.patch.set_alpha(0)
-    ax_quartiles.patch.set_facecolor("#000000")
-    ax_quartiles.patch.set_alpha(0)
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[1] for x in growth_rates_dict.values()],
-                         label="25th percentile", color="#ef4444")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[2] for x in growth_rates_dict.values()],
-                         label="50th percentile", color="#eab308")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[3] for x in growth_rates_dict.values()],
-                         label="75th percentile", color="#3b82f6")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[4] for x in growth_rates_dict.values()],
-                         label="90th percentile", color="#22c55e")
-    ax_quartiles.scatter(x=list(map(int, growth_rates_dict.keys())),
-                         y=[x[5] for x in growth_rates_dict.values()],
-                         label="99th percentile", color="#166534")
-    plt.ylim(0,10)
-    plt.axhline(y=stock_benchmark, color='#ef4444', linestyle='dashed', linewidth=3)
-    ax_quartiles.tick_params(color='white', labelcolor="white")
-    for spine in ax_quartiles.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Scatterplot of Growth Rates vs. Return Multiples at Various Quartiles (0-10x)", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.xlabel("Annual growth rate", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("Simulated fund return multiple", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    ax_quartiles.legend(loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=5,
-            frameon=False)
-    plt.setp(ax_quartiles.get_legend().get_texts(), color='white', fontproperties=ssp_font_regular,
-            fontsize=12)
-    plt.setp(ax_quartiles.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_quartiles.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_quartiles)
+    growth_rates_axis = np.array(list(map(int, growth_rates_dict.keys())))
+    with timed("page.growth_rates.average_chart"):
+        st.image(render_png(multi_scatter_chart, x=growth_rates_axis,
+                            series=[(None, np.array([x[0] for x in growth_rates_dict.values()]), None)],
+                            title="Scatterplot of Growth Rates vs. Average Return Multiples",
+                            xlabel="Average annual growth rate",
+                            ylabel="Simulated fund return multiple", benchmark=stock_benchmark))
+
+    quantile_series = [("25th percentile", np.array([x[1] for x in growth_rates_dict.values()]), "#ef4444"),
+                       ("50th percentile", np.array([x[2] for x in growth_rates_dict.values()]), "#eab308"),
+                       ("75th percentile", np.array([x[3] for x in growth_rates_dict.values()]), "#3b82f6"),
+                       ("90th percentile", np.array([x[4] for x in growth_rates_dict.values()]), "#22c55e"),
+                       ("99th percentile", np.array([x[5] for x in growth_rates_dict.values()]), "#166534")]
+
+    with timed("page.growth_rates.quantile_chart_0_1000x"):
+        st.image(render_png(multi_scatter_chart, x=growth_rates_axis, series=quantile_series,
+                            title="Scatterplot of Growth Rates vs. Return Multiples at Various Quartiles (0-1000x)",
+                            xlabel="Annual growth rate", ylabel="Simulated fund return multiple",
+                            benchmark=stock_benchmark, ylim=(0, 1000)))
+
+    with timed("page.growth_rates.quantile_chart_0_10x"):
+        st.image(render_png(multi_scatter_chart, x=growth_rates_axis, series=quantile_series,
+                            title="Scatterplot of Growth Rates vs. Return Multiples at Various Quartiles (0-10x)",
+                            xlabel="Annual growth rate", ylabel="Simulated fund return multiple",
+                            benchmark=stock_benchmark, ylim=(0, 10)))
@@ -1,7 +1,39 @@
+import time
+
 import streamlit as st
 from library import *
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as font_manager
+from cache import cached_simulation, composition_key, default_cache
+from jobs import cancel_job, current_job
+from lookup import load_default_table
+from quantiles import compute_quantiles
+from instrumentation import timed
+from charts import (histogram_chart, index_scatter_chart, render_png,
+                    stacked_bar_chart)
+
+# Seconds between progress refreshes while a background simulation is running
+JOB_REFRESH_SECONDS = 0.5
+
+# Fragments rerun part of a page on their own; Streamlit versions before 1.33
+# have neither, and fall back to rerunning the whole page
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+
+def rerun():
+    (getattr(st, "rerun", None) or st.experimental_rerun)()
+
+
+# FUNC: Shows a background job's progress. With fragments only this block
+# reruns while the job runs, and the whole page reruns once it has finished
+def job_progress(job, funds_shown, simulation_runs):
+    st.progress(job.progress)
+    st.caption("Showing results for the first {:,} of {:,} funds while the \
+    rest are simulated...".format(funds_shown, simulation_runs))
+    if job.done and fragment is not None:
+        rerun()
+
+
+if fragment is not None:
+    job_progress = fragment(run_every=JOB_REFRESH_SECONDS)(job_progress)
 
 
 def app():
@@ -52,6 +84,10 @@ def app():
         help='The percentage of profits made on the principal investment that goes \
         to the venture capitalist for generating a positive return. This is commonly \
         called "carry" in the industry.')
+        input_hurdle_percent = st.number_input(label="% hurdle rate (preferred return)", min_value=0.0, max_value=100.0, step=1.0, value=0.0,
+        help="The annual return, compounded over the fund lifespan, that limited \
+        partners receive before any carried interest is paid. Once it is met, the \
+        venture capitalist catches up on their share of the profits.")
         input_fund_lifespan = st.number_input(label="Fund lifespan in years", min_value=1, max_value=100, step=1, value=10,
         help="The amount of years the venture fund is expected to exist before all \
         capital must be returned to its limited partners.")
@@ -61,6 +97,16 @@ def app():
         input_simulation_runs= st.number_input(label="# of funds to simulate", min_value=1, max_value=100000, step=1, value=2500,
         help="The total number of venture funds to simulate using the selected \
         paramters.")
+        input_seed = st.number_input(label="Random seed", min_value=0, max_value=2**31 - 1, step=1, value=2022,
+        help="The seed for the random draws. The same parameters and seed always \
+        produce the same simulated funds, and results are reused instead of being \
+        simulated again.")
+        input_sampling = st.selectbox(label="Sampling method", options=SAMPLING_METHODS,
+        help="How the random draws are spread out. 'random' draws independent funds. \
+        'antithetic' pairs every fund with a mirrored twin, 'stratified' spreads each \
+        company's draws evenly across the funds, and 'sobol' and 'halton' use \
+        quasi-random sequences. The variance-reduction methods usually pin down the \
+        percentiles with fewer funds.")
 
 
     # SECTION: ERRORS, WARNINGS, AND INFO INDICATORS
@@ -81,32 +127,70 @@ def app():
 
     if input_simulation_runs > 2500:
         st.info("Please be aware that running more than 2,500 fund simulations at a \
-        time is very resource intensive and will take a while for Streamlit to process.")
+        time is very resource intensive. The results below are refined as the funds \
+        are simulated, and changing any parameter restarts the simulation.")
 
 
     # SECTION: TITLE
     st.title("Venture Fund Simulator")
     st.markdown("##")
 
-    sim_data = simulate_multiple_funds([input_prob_dist_zero / 100.0,
-                                        input_prob_dist_liquidation / 100.0,
-                                        input_prob_dist_multiple / 100.0],
-                                    input_liquidation_pct / 100.0,
-                                    input_average_yoy_growth / 100.0,
-                                    input_average_exit_time,
-                                    input_portfolio_size,
-                                    input_simulation_runs)
-
-    raw_returns_list = calculate_raw_fund_returns(sim_data)
+    # Show an instant estimate from the precomputed lookup table (if one has
+    # been built) while the exact simulation runs or is fetched from the cache
+    estimate_placeholder = st.empty()
+    quantile_table = load_default_table()
+    if quantile_table is not None:
+        estimated_quantiles = calculate_actual_fund_returns(
+            quantile_table.lookup(calculate_alpha(input_average_yoy_growth / 100.0,
+                                                  input_average_exit_time),
+                                  [input_prob_dist_zero, input_prob_dist_liquidation,
+                                   input_prob_dist_multiple],
+                                  input_liquidation_pct / 100.0,
+                                  input_portfolio_size),
+            input_management_fee_percent / 100.0, input_fund_lifespan,
+            input_carry_percent / 100.0, input_hurdle_percent / 100.0)
+        estimate_placeholder.info("Simulating... Estimated fund return multiples: " +
+                                  ", ".join("{:.1f}x at the {:.0f}th percentile".format(value, 100 * q)
+                                            for q, value in zip(quantile_table.quantiles,
+                                                                estimated_quantiles)))
+
+    # Stream the simulation chunk by chunk, keeping only the per-fund returns
+    # and the per-bucket composition sums. Results are cached on the inputs
+    # that affect the draws, so fee and lifespan changes reuse them. Anything
+    # not cached yet is simulated by a background job, and the page renders
+    # the chunks finished so far until the job completes
+    simulation_params = ([input_prob_dist_zero / 100.0,
+                          input_prob_dist_liquidation / 100.0,
+                          input_prob_dist_multiple / 100.0],
+                         input_liquidation_pct / 100.0,
+                         input_average_yoy_growth / 100.0,
+                         input_average_exit_time,
+                         input_portfolio_size,
+                         input_simulation_runs,
+                         input_seed,
+                         input_sampling)
+    if composition_key(*simulation_params) in default_cache:
+        cancel_job(st.session_state)
+        simulation_job = None
+        raw_returns_list, fund_composition = cached_simulation(*simulation_params)
+    else:
+        simulation_job = current_job(st.session_state, *simulation_params)
+        while simulation_job.chunks_done == 0 and not simulation_job.wait(0.05):
+            pass
+        if simulation_job.error is not None:
+            raise simulation_job.error
+        raw_returns_list, fund_composition = simulation_job.snapshot()
+
+    if simulation_job is None or simulation_job.done:
+        estimate_placeholder.empty()
+    else:
+        job_progress(simulation_job, len(raw_returns_list), input_simulation_runs)
     actual_returns_list = calculate_actual_fund_returns(raw_returns_list,
                                                         input_management_fee_percent
                                                         / 100.0,
-                                                        input_fund_lifespan)
-
-    # Configure necessary fonts for matplotlib
-    ssp_font_regular = font_manager.FontProperties(fname='./Source_Sans_Pro/SourceSansPro-Regular.ttf')
-    ssp_font_bold = font_manager.FontProperties(fname='./Source_Sans_Pro/SourceSansPro-Bold.ttf')
-    ssp_font_semibold = font_manager.FontProperties(fname='./Source_Sans_Pro/SourceSansPro-SemiBold.ttf')
+                                                        input_fund_lifespan,
+                                                        input_carry_percent / 100.0,
+                                                        input_hurdle_percent / 100.0)
 
 
     # SECTION: OVERVIEW OF SIMULATED FUND RETURNS
@@ -115,15 +199,14 @@ def app():
     st.markdown("#### A) Quick overview")
     st.markdown("Given `{}` venture funds with a portfolio size of `{}` \
     companies each, below is a breakdown of fund returns after the `{}%` \
-    management fee has been deducted.".format(input_simulation_runs,
-                                              input_portfolio_size,
-                                              input_management_fee_percent))
+    management fee and `{}%` carried interest have been \
+    deducted.".format(input_simulation_runs,
+                      input_portfolio_size,
+                      input_management_fee_percent,
+                      input_carry_percent))
 
-    actual_quantile_25 = np.quantile(actual_returns_list, q=0.25)
-    actual_quantile_50 = np.quantile(actual_returns_list, q=0.50)
-    actual_quantile_75 = np.quantile(actual_returns_list, q=0.75)
-    actual_quantile_90 = np.quantile(actual_returns_list, q=0.90)
-    actual_quantile_99 = np.quantile(actual_returns_list, q=0.99)
+    (actual_quantile_25, actual_quantile_50, actual_quantile_75, actual_quantile_90,
+     actual_quantile_99) = compute_quantiles(actual_returns_list, [0.25, 0.50, 0.75, 0.90, 0.99])
 
     actual_stat_col1, actual_stat_col2, actual_stat_col3, actual_stat_col4, actual_stat_col5 = st.columns(5)
     actual_stat_col1.metric("25th Percentile", "{0:.1f}x".format(actual_quantile_25))
@@ -132,22 +215,10 @@ def app():
     actual_stat_col4.metric("90th Percentile", "{0:.1f}x".format(actual_quantile_90))
     actual_stat_col5.metric("99th Percentile", "{0:.1f}x".format(actual_quantile_99))
 
-    fig_overview, ax_overview = plt.subplots(figsize=(12, 4))
-    fig_overview.patch.set_facecolor("#000000")
-    fig_overview.patch.set_alpha(0)
-    ax_overview.patch.set_facecolor("#000000")
-    ax_overview.patch.set_alpha(0)
-    ax_overview.hist(x=actual_returns_list, range=(1,100), rwidth=1, color="#14BAA6")
-    ax_overview.tick_params(color='white', labelcolor="white")
-    for spine in ax_overview.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Histogram of Fund Return Multiples", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.xlabel("Return Multiple", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("Frequency", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.setp(ax_overview.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_overview.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_overview)
+    with timed("page.simulator.return_histogram"):
+        st.image(render_png(histogram_chart, values=np.asarray(actual_returns_list),
+                            value_range=(1, 100), title="Histogram of Fund Return Multiples",
+                            xlabel="Return Multiple", ylabel="Frequency"))
 
     cagr_quantile_25 = 100 * convert_moic_to_cagr(actual_quantile_25, input_fund_lifespan)
     cagr_quantile_50 = 100 * convert_moic_to_cagr(actual_quantile_50, input_fund_lifespan)
@@ -191,50 +262,21 @@ def app():
                                           actual_returns_list))) /
                           len(actual_returns_list)) * 100))
 
-    fig_lower_mult, ax_lower_mult = plt.subplots(figsize=(12, 6))
-    fig_lower_mult.patch.set_facecolor("#000000")
-    fig_lower_mult.patch.set_alpha(0)
-    ax_lower_mult.patch.set_facecolor("#000000")
-    ax_lower_mult.patch.set_alpha(0)
-    ax_lower_mult.scatter(x=np.arange(0,len(actual_returns_list)), y=actual_returns_list,
-                color="#14BAA6", s=3)
-    plt.ylim(0,50)
-    plt.axhline(y=stock_benchmark, color='#ef4444', linestyle='dashed', linewidth=3)
-    ax_lower_mult.tick_params(color='white', labelcolor="white")
-    for spine in ax_lower_mult.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Scatterplot of Fund Return Multiples (0-50x)", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.xlabel("Fund #", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("Multiple", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.setp(ax_lower_mult.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_lower_mult.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_lower_mult)
-
-
-    fig_upper_mult, ax_upper_mult = plt.subplots(figsize=(12, 6))
-    fig_upper_mult.patch.set_facecolor("#000000")
-    fig_upper_mult.patch.set_alpha(0)
-    ax_upper_mult.patch.set_facecolor("#000000")
-    ax_upper_mult.patch.set_alpha(0)
-    filtered_list = list(filter(lambda x: x > 50, actual_returns_list))
-    ax_upper_mult.scatter(x=np.arange(0,len(filtered_list)), y=filtered_list, color="#14BAA6", s=50)
-    plt.ylim(0,np.max(actual_returns_list) + 100)
-    plt.axhline(y=stock_benchmark, color='#ef4444', linestyle='dashed', linewidth=3)
-    ax_upper_mult.tick_params(color='white', labelcolor="white")
-    for spine in ax_upper_mult.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Scatterplot of Fund Return Multiples (>50x)", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.xlabel("Fund #", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("Multiple", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.setp(ax_upper_mult.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_upper_mult.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_upper_mult)
-    st.markdown("###")
+    with timed("page.simulator.return_scatter_0_50x"):
+        st.image(render_png(index_scatter_chart, values=np.asarray(actual_returns_list),
+                            ylim=(0, 50), title="Scatterplot of Fund Return Multiples (0-50x)",
+                            xlabel="Fund #", ylabel="Multiple", benchmark=stock_benchmark))
 
 
-    fund_analysis_list = analyze_fund_returns(sim_data, raw_returns_list, input_portfolio_size)
+    filtered_list = np.asarray(actual_returns_list)[np.asarray(actual_returns_list) > 50]
+    with timed("page.simulator.return_scatter_over_50x"):
+        st.image(render_png(index_scatter_chart, values=filtered_list,
+                            ylim=(0, np.max(actual_returns_list) + 100),
+                            title="Scatterplot of Fund Return Multiples (>50x)",
+                            xlabel="Fund #", ylabel="Multiple", benchmark=stock_benchmark,
+                            marker_size=50))
+    st.markdown("###")
+
 
     st.subheader("III. Analysis of the power law")
     st.markdown("VC returns notoriously follow a [power law \
@@ -265,43 +307,23 @@ def app():
     composition of each bucket in terms of the averaged relative proportions of \
     companies that make up each the funds within that bucket.")
 
-    fig_comp, ax_comp = plt.subplots(figsize=(12, 6))
-    fig_comp.patch.set_facecolor("#000000")
-    fig_comp.patch.set_alpha(0)
-    ax_comp.patch.set_facecolor("#000000")
-    ax_comp.patch.set_alpha(0)
     labels = ['Failed Fund', 'Breakeven Fund', 'Moderately Successful Fund', 'Winner Fund']
 
-    pct_comp_less_1x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_comp_less_1x')
-    pct_comp_1x_2x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_comp_1x_2x')
-    pct_comp_2x_3x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_comp_2x_3x')
-    pct_comp_3x_10x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_comp_3x_10x')
-    pct_comp_greateq_10x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_comp_greateq_10x')
-
-    ax_comp.bar(labels, pct_comp_less_1x, label='Companies returning < 1x', color="#ef4444")
-    ax_comp.bar(labels, pct_comp_1x_2x, label='Companies returning 1-2x',
-            bottom=pct_comp_less_1x, color="#eab308")
-    ax_comp.bar(labels, pct_comp_2x_3x, label='companies returning 2-3x',
-            bottom=pct_comp_less_1x+pct_comp_1x_2x, color="#3b82f6")
-    ax_comp.bar(labels, pct_comp_3x_10x, label='companies returning 3-10x',
-            bottom=pct_comp_less_1x+pct_comp_1x_2x+pct_comp_2x_3x, color="#22c55e")
-    ax_comp.bar(labels, pct_comp_greateq_10x, label='Companies returning ≥10x',
-            bottom=pct_comp_less_1x+pct_comp_1x_2x+pct_comp_2x_3x+pct_comp_3x_10x, color="#166534")
-    ax_comp.tick_params(color='white', labelcolor="white")
-    plt.ylim(0,105,1)
-    for spine in ax_comp.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Breakdown of Fund Composition", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.xlabel("Bucket of Fund", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("% of Fund Composition", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    ax_comp.legend(loc='upper center', bbox_to_anchor=(0.5, -0.12), ncol=5,
-            frameon=False)
-    plt.setp(ax_comp.get_legend().get_texts(), color='white', fontproperties=ssp_font_regular,
-            fontsize=12)
-    plt.setp(ax_comp.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_comp.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_comp)
+    pct_comp_less_1x = 100 * fund_composition.bucket_averages('pct_comp_less_1x')
+    pct_comp_1x_2x = 100 * fund_composition.bucket_averages('pct_comp_1x_2x')
+    pct_comp_2x_3x = 100 * fund_composition.bucket_averages('pct_comp_2x_3x')
+    pct_comp_3x_10x = 100 * fund_composition.bucket_averages('pct_comp_3x_10x')
+    pct_comp_greateq_10x = 100 * fund_composition.bucket_averages('pct_comp_greateq_10x')
+
+    with timed("page.simulator.composition_chart"):
+        st.image(render_png(stacked_bar_chart, labels=labels,
+                            series=[('Companies returning < 1x', pct_comp_less_1x, "#ef4444"),
+                                    ('Companies returning 1-2x', pct_comp_1x_2x, "#eab308"),
+                                    ('companies returning 2-3x', pct_comp_2x_3x, "#3b82f6"),
+                                    ('companies returning 3-10x', pct_comp_3x_10x, "#22c55e"),
+                                    ('Companies returning ≥10x', pct_comp_greateq_10x, "#166534")],
+                            title="Breakdown of Fund Composition", xlabel="Bucket of Fund",
+                            ylabel="% of Fund Composition"))
 
     st.markdown("#### B) Source of fund returns")
     st.markdown("Finally, we can look at the source of returns for each bucket. \
@@ -315,42 +337,21 @@ def app():
     type of company within that fund, averaged for all funds in a given performance bucket.")
 
 
-    fig_return, ax_return = plt.subplots(figsize=(12, 6))
-    fig_return.patch.set_facecolor("#000000")
-    fig_return.patch.set_alpha(0)
-    ax_return.patch.set_facecolor("#000000")
-    ax_return.patch.set_alpha(0)
-
-    pct_return_less_1x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_return_less_1x')
-    pct_return_1x_2x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_return_1x_2x')
-    pct_return_2x_3x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_return_2x_3x')
-    pct_return_3x_10x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_return_3x_10x')
-    pct_return_greateq_10x = 100 * get_averages_for_variable_across_buckets(fund_analysis_list, 'pct_return_greateq_10x')
-
-    ax_return.bar(labels, pct_return_less_1x, label='Companies returning < 1x', color="#ef4444")
-    ax_return.bar(labels, pct_return_1x_2x, label='Companies returning 1-2x',
-            bottom=pct_return_less_1x, color="#eab308")
-    ax_return.bar(labels, pct_return_2x_3x, label='Companies returning 2-3x',
-            bottom=pct_return_less_1x+pct_return_1x_2x, color="#3b82f6")
-    ax_return.bar(labels, pct_return_3x_10x, label='Companies returning 3-10x',
-            bottom=pct_return_less_1x+pct_return_1x_2x+pct_return_2x_3x, color="#22c55e")
-    ax_return.bar(labels, pct_return_greateq_10x, label='Companies returning ≥10x',
-            bottom=pct_return_less_1x+pct_return_1x_2x+pct_return_2x_3x+pct_return_3x_10x, color="#166534")
-    ax_return.tick_params(color='white', labelcolor="white")
-    plt.ylim(0,105,1)
-    for spine in ax_return.spines.values():
-            spine.set_edgecolor('white')
-    plt.title("Breakdown of Fund Returns", color="white",
-            fontproperties=ssp_font_bold, fontsize=18)
-    plt.xlabel("Bucket of Fund", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    plt.ylabel("% of Fund Returns", color="white", fontproperties=ssp_font_semibold, fontsize=14)
-    ax_return.legend(loc='upper center', bbox_to_anchor=(0.5, -0.12), ncol=5,
-            frameon=False)
-    plt.setp(ax_return.get_legend().get_texts(), color='white', fontproperties=ssp_font_regular,
-            fontsize=12)
-    plt.setp(ax_return.get_xticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    plt.setp(ax_return.get_yticklabels(), fontproperties=ssp_font_regular, fontsize=13)
-    st.pyplot(fig_return)
+    pct_return_less_1x = 100 * fund_composition.bucket_averages('pct_return_less_1x')
+    pct_return_1x_2x = 100 * fund_composition.bucket_averages('pct_return_1x_2x')
+    pct_return_2x_3x = 100 * fund_composition.bucket_averages('pct_return_2x_3x')
+    pct_return_3x_10x = 100 * fund_composition.bucket_averages('pct_return_3x_10x')
+    pct_return_greateq_10x = 100 * fund_composition.bucket_averages('pct_return_greateq_10x')
+
+    with timed("page.simulator.source_of_returns_chart"):
+        st.image(render_png(stacked_bar_chart, labels=labels,
+                            series=[('Companies returning < 1x', pct_return_less_1x, "#ef4444"),
+                                    ('Companies returning 1-2x', pct_return_1x_2x, "#eab308"),
+                                    ('Companies returning 2-3x', pct_return_2x_3x, "#3b82f6"),
+                                    ('Companies returning 3-10x', pct_return_3x_10x, "#22c55e"),
+                                    ('Companies returning ≥10x', pct_return_greateq_10x, "#166534")],
+                            title="Breakdown of Fund Returns", xlabel="Bucket of Fund",
+                            ylabel="% of Fund Returns"))
 
     st.markdown("As you can see in the above two charts, the composition of the \
     funds is relatively similar across each bucket with minor variation. \
@@ -383,3 +384,10 @@ def app():
     st.markdown("And of course, thanks to [Streamlit](https://streamlit.io/) for \
     providing a fantastic interactive app library for Python. This project would \
     not be possible without it!")
+
+    # Without fragments, rerun the whole page to pick up the chunks finished in
+    # the meantime. Changing a widget also reruns it, which cancels the job if
+    # its parameters changed
+    if fragment is None and simulation_job is not None and not simulation_job.done:
+        time.sleep(JOB_REFRESH_SECONDS)
+        rerun()
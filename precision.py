@@ -0,0 +1,63 @@
+"""
+Target-precision mode for the simulation.
+
+Instead of a fixed number of runs, simulate_to_precision keeps adding chunks of
+funds until the confidence intervals of the requested quantiles of the raw
+fund returns are narrow enough, then stops. Every chunk has its own random
+stream (and, for the quasi-Monte Carlo methods, its own scrambling), so the
+chunks are independent replicates. The standard error of each quantile is
+estimated from the spread of the per-chunk quantiles (batch means), which also
+holds for the antithetic, stratified and QMC sampling methods where the funds
+within a chunk are not independent.
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+
+from library import (DEFAULT_CHUNK_SIZE, as_seed_sequence, calculate_alpha,
+                     fund_raw_returns, simulate_chunk)
+from quantiles import compute_quantiles
+
+DEFAULT_QUANTILES = (0.25, 0.50, 0.75, 0.90, 0.99)
+
+
+# FUNC: Simulates chunks of funds until the confidence interval half-width of
+# every requested quantile is within rel_tolerance of its estimate (or max_runs
+# funds have been simulated). The first k chunks are the same funds that
+# simulate_fund_returns draws for k * chunk_size runs with the same seed.
+# Returns the raw fund returns and a report of the estimates and intervals
+def simulate_to_precision(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, quantiles=DEFAULT_QUANTILES, rel_tolerance=0.02, confidence=0.95, seed=None, sampling="random", chunk_size=DEFAULT_CHUNK_SIZE, min_chunks=8, max_runs=1000000):
+    alpha = calculate_alpha(average_yoy_growth, average_exit_time)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    seed_seq = as_seed_sequence(seed)
+    max_chunks = max(int(max_runs) // int(chunk_size), min_chunks)
+
+    chunk_returns, chunk_quantiles = [], []
+    converged = False
+    while len(chunk_returns) < max_chunks:
+        # Spawning one child at a time yields the same streams as plan_chunks
+        child, = seed_seq.spawn(1)
+        returns = fund_raw_returns(simulate_chunk(prob_dist, liquidation_pct, alpha,
+                                                  portfolio_size, chunk_size, child, sampling))
+        chunk_returns.append(returns)
+        chunk_quantiles.append(compute_quantiles(returns, quantiles))
+
+        if len(chunk_returns) >= min_chunks:
+            estimates = np.mean(chunk_quantiles, axis=0)
+            half_widths = z * np.std(chunk_quantiles, axis=0, ddof=1) / np.sqrt(len(chunk_returns))
+            if np.all(half_widths <= rel_tolerance * np.abs(estimates)):
+                converged = True
+                break
+
+    raw_returns = np.concatenate(chunk_returns)
+    half_widths = (z * np.std(chunk_quantiles, axis=0, ddof=1) / np.sqrt(len(chunk_returns))
+                   if len(chunk_returns) > 1 else np.full(len(quantiles), np.inf))
+    report = {"quantiles": list(quantiles),
+              "estimates": compute_quantiles(raw_returns, quantiles),
+              "half_widths": half_widths,
+              "confidence": confidence,
+              "runs": len(raw_returns),
+              "chunks": len(chunk_returns),
+              "converged": converged}
+    return raw_returns, report
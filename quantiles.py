@@ -0,0 +1,161 @@
+"""
+Quantile engine for fund return distributions.
+
+compute_quantiles gets any set of percentiles from an ndarray with a single
+partition pass, and matches np.quantile's default (linear) interpolation.
+QuantileSketch is a mergeable KLL-style sketch for chunked or distributed runs:
+it keeps O(k log(n / k)) values no matter how many funds it has seen, and
+reports a bound on the rank error of the quantiles it returns.
+weighted_quantiles and the sketch's integer counts support weighted samples,
+such as importance-sampled funds (see importance.py).
+"""
+
+import math
+
+import numpy as np
+
+
+# FUNC: Computes the quantiles qs of values along the last axis in one
+# np.partition pass, with the same linear interpolation as np.quantile
+def compute_quantiles(values, qs):
+    values = np.asarray(values, dtype=np.float64)
+    qs = np.asarray(qs, dtype=np.float64)
+    n = values.shape[-1]
+
+    positions = qs * (n - 1)
+    lower = np.floor(positions).astype(np.intp)
+    upper = np.minimum(lower + 1, n - 1)
+    partitioned = np.partition(values, np.unique(np.concatenate([lower, upper])), axis=-1)
+
+    lower_values = partitioned[..., lower]
+    upper_values = partitioned[..., upper]
+    return lower_values + (upper_values - lower_values) * (positions - lower)
+
+
+# FUNC: Computes the quantiles qs of weighted values: for each q, the smallest
+# value whose cumulative weight reaches q times the total weight
+def weighted_quantiles(values, weights, qs):
+    values = np.asarray(values, dtype=np.float64).ravel()
+    weights = np.asarray(weights, dtype=np.float64).ravel()
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    ranks = np.asarray(qs, dtype=np.float64) * cumulative[-1]
+    indices = np.minimum(np.searchsorted(cumulative, ranks, side="left"), len(values) - 1)
+    return values[order][indices]
+
+
+class QuantileSketch:
+    """Mergeable KLL-style quantile sketch.
+
+    Values are kept in a hierarchy of compactors; level h holds values that each
+    stand for 2^h of the original ones. When a level overflows it is sorted and
+    every other value (from a random offset) is promoted to the next level.
+
+    Args:
+        k: capacity of the top compactor; the rank error shrinks roughly as 1/k
+        seed: seed for the random compaction offsets
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.rng = np.random.default_rng(seed)
+        self.levels = [np.empty(0)]
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+        # Each compaction at level h shifts any rank by at most 2^h; the sum is
+        # a worst-case bound, the sum of squares feeds a Hoeffding bound
+        self.worst_case_error = 0
+        self.error_sum_squares = 0
+
+    def capacity(self, level):
+        height = len(self.levels)
+        return max(int(math.ceil(self.k * (2.0 / 3.0) ** (height - 1 - level))), 2)
+
+    def update(self, values, counts=None):
+        """Adds values to the sketch, each one counts times (a non-negative
+        integer array) if given. Counts are split into their binary digits, so
+        a value is stored once on every level whose bit is set."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if counts is not None:
+            counts = np.asarray(counts, dtype=np.int64).ravel()
+            values, counts = values[counts > 0], counts[counts > 0]
+        if values.size == 0:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        if counts is None:
+            self.count += values.size
+            self.levels[0] = np.concatenate([self.levels[0], values])
+        else:
+            self.count += int(counts.sum())
+            level = 0
+            while values.size:
+                if level == len(self.levels):
+                    self.levels.append(np.empty(0))
+                has_bit = (counts & 1).astype(bool)
+                self.levels[level] = np.concatenate([self.levels[level], values[has_bit]])
+                counts >>= 1
+                values, counts = values[counts > 0], counts[counts > 0]
+                level += 1
+        self.compress()
+
+    def merge(self, other):
+        """Folds another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.worst_case_error += other.worst_case_error
+        self.error_sum_squares += other.error_sum_squares
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) > self.capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+
+                # An odd value out stays behind so the compaction is exact in count
+                keep = items[:len(items) % 2]
+                promoted = items[len(keep) + self.rng.integers(2)::2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+                weight = 2 ** level
+                self.worst_case_error += weight
+                self.error_sum_squares += weight ** 2
+            level += 1
+
+    def quantiles(self, qs):
+        """Returns the approximate values at the quantiles qs."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2.0 ** level)
+                                  for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items)
+        items, cumulative = items[order], np.cumsum(weights[order])
+
+        ranks = np.asarray(qs, dtype=np.float64) * cumulative[-1]
+        indices = np.minimum(np.searchsorted(cumulative, ranks, side="left"), len(items) - 1)
+        result = items[indices]
+        result = np.where(np.asarray(qs) <= 0, self.min, result)
+        return np.where(np.asarray(qs) >= 1, self.max, result)
+
+    def rank_error(self, confidence=0.99):
+        """Returns (worst-case, probabilistic) bounds on the normalized rank
+        error, i.e. the quantile returned for q lies between the true
+        quantiles at q - error and q + error. The probabilistic bound holds
+        with the given confidence for any single query."""
+        if self.count == 0:
+            return 0.0, 0.0
+        hoeffding = math.sqrt(2.0 * self.error_sum_squares * math.log(2.0 / (1.0 - confidence)))
+        worst_case = self.worst_case_error
+        return worst_case / self.count, min(hoeffding, worst_case) / self.count
@@ -0,0 +1,172 @@
+"""
+Online reducers for the streaming simulation mode.
+
+Each reducer folds a (funds x portfolio_size) chunk of company outcomes, as
+yielded by library.iter_fund_chunks, into a small running state. Once every
+reducer has seen a chunk it can be discarded, so memory stays bounded by the
+chunk size rather than by the number of simulated funds.
+
+Every update also takes optional per-fund weights, such as the likelihood
+ratios of importance-sampled funds (see importance.py), in which case the
+reducer reports weighted estimates.
+"""
+
+import numpy as np
+
+from library import (COMPANY_BINS, FUND_BUCKETS, company_bin_shares,
+                     fund_bucket_indices, fund_raw_returns)
+from quantiles import QuantileSketch
+
+
+class FundReturnReducer:
+    """Collects the raw return multiple (and weight, if any) of every fund."""
+
+    def __init__(self):
+        self.chunks = []
+        self.weight_chunks = []
+
+    def update(self, chunk, weights=None):
+        self.chunks.append(fund_raw_returns(chunk))
+        if weights is not None:
+            self.weight_chunks.append(np.asarray(weights, dtype=np.float64))
+
+    def merge(self, other):
+        self.chunks.extend(other.chunks)
+        self.weight_chunks.extend(other.weight_chunks)
+
+    def result(self):
+        if not self.chunks:
+            return np.empty(0, dtype=np.float64)
+        return np.concatenate(self.chunks)
+
+    def weights(self):
+        """Returns the weight of every fund, or None for unweighted funds."""
+        if not self.weight_chunks:
+            return None
+        return np.concatenate(self.weight_chunks)
+
+
+class FundQuantileReducer:
+    """Tracks approximate quantiles of the raw fund returns in a mergeable
+    QuantileSketch, using O(k log n) memory instead of 8 bytes per fund.
+
+    Weighted funds enter the sketch weight * weight_resolution times, rounded
+    up or down at random so the counts are unbiased.
+    """
+
+    def __init__(self, k=200, seed=None, weight_resolution=64):
+        self.sketch = QuantileSketch(k, seed)
+        self.weight_resolution = weight_resolution
+
+    def update(self, chunk, weights=None):
+        if weights is None:
+            self.sketch.update(fund_raw_returns(chunk))
+            return
+        scaled = np.asarray(weights, dtype=np.float64) * self.weight_resolution
+        counts = np.floor(scaled + self.sketch.rng.random(scaled.shape)).astype(np.int64)
+        self.sketch.update(fund_raw_returns(chunk), counts)
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+
+    def quantiles(self, qs):
+        return self.sketch.quantiles(qs)
+
+    def rank_error(self, confidence=0.99):
+        return self.sketch.rank_error(confidence)
+
+
+class FundBucketReducer:
+    """Counts how many funds land in each performance bucket.
+
+    Args:
+        scale: multiplier applied to the raw fund returns before bucketing,
+            e.g. the share of capital left after management fees
+    """
+
+    def __init__(self, scale=1.0):
+        self.scale = scale
+        self.counts = np.zeros(len(FUND_BUCKETS))
+
+    def update(self, chunk, weights=None):
+        buckets = fund_bucket_indices(fund_raw_returns(chunk) * self.scale)
+        self.counts += np.bincount(buckets, weights=weights, minlength=len(FUND_BUCKETS))
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    def fractions(self):
+        total = self.counts.sum()
+        if total == 0:
+            return np.zeros(len(FUND_BUCKETS))
+        return self.counts / total
+
+
+class CompositionReducer:
+    """Sums the per-fund company composition and source of returns by bucket.
+
+    The averages it reports match get_averages_for_variable_across_buckets on
+    the output of analyze_fund_returns, for the pct_comp_* and pct_return_*
+    variables. With weights, fund_counts holds the total weight per bucket and
+    the averages are weighted.
+    """
+
+    def __init__(self):
+        self.fund_counts = np.zeros(len(FUND_BUCKETS))
+        self.comp_sums = np.zeros((len(FUND_BUCKETS), len(COMPANY_BINS)))
+        self.return_sums = np.zeros((len(FUND_BUCKETS), len(COMPANY_BINS)))
+
+    def update(self, chunk, weights=None):
+        pct_comp, pct_return = company_bin_shares(chunk)
+        buckets = fund_bucket_indices(fund_raw_returns(chunk))
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)
+            pct_comp = pct_comp * weights[:, np.newaxis]
+            pct_return = pct_return * weights[:, np.newaxis]
+
+        self.fund_counts += np.bincount(buckets, weights=weights, minlength=len(FUND_BUCKETS))
+        np.add.at(self.comp_sums, buckets, pct_comp)
+        np.add.at(self.return_sums, buckets, pct_return)
+
+    def merge(self, other):
+        self.fund_counts += other.fund_counts
+        self.comp_sums += other.comp_sums
+        self.return_sums += other.return_sums
+
+    def to_arrays(self):
+        return {"fund_counts": self.fund_counts, "comp_sums": self.comp_sums,
+                "return_sums": self.return_sums}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        reducer = cls()
+        reducer.fund_counts = np.array(arrays["fund_counts"])
+        reducer.comp_sums = np.array(arrays["comp_sums"])
+        reducer.return_sums = np.array(arrays["return_sums"])
+        return reducer
+
+    def bucket_averages(self, var):
+        """Returns the average of var (e.g. 'pct_comp_1x_2x') for each bucket,
+        with 0.0 for empty buckets."""
+        kind, company_bin = var[len("pct_"):].split("_", 1)
+        sums = self.comp_sums if kind == "comp" else self.return_sums
+        column = sums[:, COMPANY_BINS.index(company_bin)]
+        return np.divide(column, self.fund_counts, out=np.zeros(len(FUND_BUCKETS)),
+                         where=self.fund_counts != 0)
+
+
+# FUNC: Feeds every chunk to every reducer, then returns the reducers
+def reduce_fund_chunks(chunks, reducers):
+    for chunk in chunks:
+        for reducer in reducers:
+            reducer.update(chunk)
+    return reducers
+
+
+# FUNC: Feeds every (chunk, weights) pair to every reducer, then returns the
+# reducers
+def reduce_weighted_fund_chunks(weighted_chunks, reducers):
+    for chunk, weights in weighted_chunks:
+        for reducer in reducers:
+            reducer.update(chunk, weights)
+    return reducers
@@ -0,0 +1,97 @@
+"""
+Compact storage for simulated portfolios.
+
+SimulationResult keeps every company outcome in one contiguous float32 (or
+float64) array, with the categorical outcome code (see library.OUTCOME_*) in a
+uint8 side array: 5 bytes per company instead of the 32+ of a list of Python
+floats. When the arrays would exceed a RAM budget they are backed by
+numpy.memmap files instead, so very large runs stay within a fixed memory
+footprint. The analysis functions in library.py read it chunk by chunk.
+"""
+
+import os
+import shutil
+import tempfile
+import weakref
+
+import numpy as np
+
+from library import (DEFAULT_CHUNK_SIZE, calculate_alpha, plan_chunks,
+                     simulate_chunk_with_codes)
+
+# Size of the outcome and code arrays above which they spill to disk
+DEFAULT_RAM_BUDGET_BYTES = 1024 * 1024 * 1024
+
+
+class SimulationResult:
+    """Simulated company outcomes of several funds.
+
+    Args:
+        outcomes: (funds x portfolio_size) array of return multiples
+        codes: matching uint8 array of outcome codes
+        chunk_size: number of funds handed out per chunk by iter_chunks
+    """
+
+    def __init__(self, outcomes, codes, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.outcomes = outcomes
+        self.codes = codes
+        self.chunk_size = chunk_size
+        self.spill_dir = None
+
+    @classmethod
+    def allocate(cls, simulation_runs, portfolio_size, dtype=np.float32, ram_budget_bytes=DEFAULT_RAM_BUDGET_BYTES, spill_dir=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Creates an empty result, backed by memmap files in a temporary
+        directory (under spill_dir, if given) when it exceeds ram_budget_bytes."""
+        shape = (int(simulation_runs), int(portfolio_size))
+        nbytes = shape[0] * shape[1] * (np.dtype(dtype).itemsize + 1)
+        if nbytes <= ram_budget_bytes:
+            return cls(np.empty(shape, dtype=dtype), np.empty(shape, dtype=np.uint8), chunk_size)
+
+        directory = tempfile.mkdtemp(prefix="vc-simulation-", dir=spill_dir)
+        result = cls(np.memmap(os.path.join(directory, "outcomes.dat"), dtype=dtype, mode="w+", shape=shape),
+                     np.memmap(os.path.join(directory, "codes.dat"), dtype=np.uint8, mode="w+", shape=shape),
+                     chunk_size)
+        result.spill_dir = directory
+        weakref.finalize(result, shutil.rmtree, directory, ignore_errors=True)
+        return result
+
+    @property
+    def shape(self):
+        return self.outcomes.shape
+
+    @property
+    def nbytes(self):
+        return self.outcomes.nbytes + self.codes.nbytes
+
+    @property
+    def is_spilled(self):
+        return self.spill_dir is not None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.outcomes, dtype=dtype)
+
+    def iter_chunks(self, chunk_size=None):
+        """Yields the outcomes as float64 arrays of at most chunk_size funds."""
+        chunk_size = chunk_size or self.chunk_size
+        for start in range(0, len(self), chunk_size):
+            yield np.asarray(self.outcomes[start:start + chunk_size], dtype=np.float64)
+
+
+# FUNC: Simulates several venture funds into a SimulationResult, one chunk at a
+# time, so peak memory is one chunk plus the (possibly memory-mapped) storage.
+# With the same seed and chunk size the outcomes match simulate_fund_matrix
+# (rounded to dtype)
+def simulate_fund_result(prob_dist, liquidation_pct, average_yoy_growth, average_exit_time, portfolio_size, simulation_runs=2500, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, dtype=np.float32, ram_budget_bytes=DEFAULT_RAM_BUDGET_BYTES, spill_dir=None, sampling="random"):
+    alpha = calculate_alpha(average_yoy_growth, average_exit_time)
+    result = SimulationResult.allocate(simulation_runs, portfolio_size, dtype, ram_budget_bytes,
+                                       spill_dir, chunk_size)
+    for start, stop, seed_seq in plan_chunks(simulation_runs, seed, chunk_size):
+        codes, outcomes = simulate_chunk_with_codes(prob_dist, liquidation_pct, alpha,
+                                                    portfolio_size, stop - start, seed_seq,
+                                                    sampling)
+        result.outcomes[start:stop] = outcomes
+        result.codes[start:stop] = codes
+    return result
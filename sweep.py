@@ -0,0 +1,79 @@
+"""
+Growth-rate sweep engine.
+
+Only alpha changes between the growth rates of a sweep, so the outcome codes
+and the power-law uniforms are drawn once per chunk and re-mapped through each
+alpha's inverse CDF (common random numbers). Every growth rate therefore sees
+the same companies, which turns each step into a cheap transform and makes the
+resulting curves smooth rather than noisy.
+"""
+
+import numpy as np
+
+from library import (DEFAULT_CHUNK_SIZE, OUTCOME_LIQUIDATION, OUTCOME_MULTIPLE,
+                     calculate_actual_fund_returns, calculate_alpha, draw_chunk_uniforms,
+                     draw_outcome_codes, plan_chunks)
+from quantiles import compute_quantiles
+
+
+# FUNC: Simulates the raw return of every fund for each alpha in alphas using
+# common random numbers. Returns a (len(alphas) x simulation_runs) ndarray of
+# dtype, which may be float32 to halve the memory of large sweeps
+def sweep_alphas(prob_dist, liquidation_pct, alphas, portfolio_size, simulation_runs=2500, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, sampling="random", dtype=np.float64):
+    exponents = 1.0 / (np.asarray(alphas, dtype=np.float64) - 1.0)
+    raw_returns = np.empty((len(exponents), int(simulation_runs)), dtype=dtype)
+
+    for start, stop, seed_seq in plan_chunks(simulation_runs, seed, chunk_size):
+        outcome_uniforms, multiple_uniforms = draw_chunk_uniforms(stop - start, portfolio_size,
+                                                                  seed_seq, sampling)
+        codes = draw_outcome_codes(prob_dist, outcome_uniforms)
+        liquidation_sums = (codes == OUTCOME_LIQUIDATION).sum(axis=1) * liquidation_pct
+
+        # The power law's inverse CDF is exp(-log(1 - u) / (alpha - 1)), so with
+        # -log(1 - u) kept around each alpha costs one multiply and one exp.
+        # Entries of non-"MULTIPLE" companies are never written and stay 0
+        is_multiple = codes == OUTCOME_MULTIPLE
+        log_tail = -np.log1p(-multiple_uniforms)
+        multiples = np.zeros_like(log_tail)
+        for i, exponent in enumerate(exponents):
+            np.multiply(log_tail, exponent, out=multiples, where=is_multiple)
+            np.exp(multiples, out=multiples, where=is_multiple)
+            raw_returns[i, start:stop] = (liquidation_sums + multiples.sum(axis=1)) / portfolio_size
+
+    return raw_returns
+
+
+# FUNC: Simulates the raw return of every fund for each average YoY growth rate
+# in growth_rates. Returns a (len(growth_rates) x simulation_runs) ndarray
+def sweep_growth_rates(prob_dist, liquidation_pct, growth_rates, average_exit_time, portfolio_size, simulation_runs=2500, seed=None, chunk_size=DEFAULT_CHUNK_SIZE, sampling="random", dtype=np.float64):
+    alphas = [calculate_alpha(growth_rate, average_exit_time) for growth_rate in growth_rates]
+    return sweep_alphas(prob_dist, liquidation_pct, alphas, portfolio_size,
+                        simulation_runs, seed, chunk_size, sampling, dtype)
+
+
+# FUNC: Summarizes a (sweep steps x funds) matrix of fund returns into the mean
+# and the requested quantiles of each step, in one vectorized pass
+def summarize_sweep(returns_matrix, quantiles=(0.25, 0.50, 0.75, 0.90, 0.99)):
+    returns_matrix = np.asarray(returns_matrix, dtype=np.float64)
+    return returns_matrix.mean(axis=1), compute_quantiles(returns_matrix, quantiles)
+
+
+# Number of sweep steps converted to net returns and summarized at a time, so
+# only a block of steps is ever held as float64 net returns
+SUMMARY_BLOCK_ROWS = 16
+
+
+# FUNC: Applies the fees to a (sweep steps x funds) matrix of raw returns and
+# summarizes the net returns of each step, block_rows steps at a time.
+# fee_kwargs are the fee arguments of calculate_actual_fund_returns
+def summarize_net_sweep(raw_returns_matrix, fee_kwargs, quantiles=(0.25, 0.50, 0.75, 0.90, 0.99), block_rows=SUMMARY_BLOCK_ROWS):
+    averages, step_quantiles = [], []
+    for start in range(0, len(raw_returns_matrix), block_rows):
+        block = np.asarray(raw_returns_matrix[start:start + block_rows], dtype=np.float64)
+        block_averages, block_quantiles = summarize_sweep(
+            calculate_actual_fund_returns(block, **fee_kwargs), quantiles)
+        averages.append(block_averages)
+        step_quantiles.append(block_quantiles)
+    if not averages:
+        return np.empty(0), np.empty((0, len(quantiles)))
+    return np.concatenate(averages), np.concatenate(step_quantiles)
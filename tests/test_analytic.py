@@ -0,0 +1,76 @@
+"""
+Cross-checks of the analytic engine (analytic.py) against seeded Monte Carlo
+runs of 20,000 funds, with the Simulator page's default parameters and with
+heavy tails and a small liquidation_pct.
+"""
+
+import time
+
+import pytest
+
+from analytic import MAX_GRID_POINTS, cross_check_monte_carlo, fund_return_distribution
+from batch import normalize_scenario, run_scenario
+
+PROB_DIST = [0.33, 0.33, 0.33]
+LIQUIDATION_PCT = 0.8
+AVERAGE_YOY_GROWTH = 0.25
+AVERAGE_EXIT_TIME = 5
+SIMULATION_RUNS = 20000
+SEED = 2022
+
+
+@pytest.mark.parametrize("portfolio_size", [1, 50])
+def test_cdf_and_body_quantiles_match_monte_carlo(portfolio_size):
+    check = cross_check_monte_carlo(PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH,
+                                    AVERAGE_EXIT_TIME, portfolio_size, SIMULATION_RUNS,
+                                    quantiles=(0.25, 0.50, 0.75, 0.90), seed=SEED)
+    # The 95% KS critical value for 20,000 draws is about 0.0096
+    assert check["ks_statistic"] < 0.015
+    assert check["max_relative_error"] < 0.05
+
+
+@pytest.mark.parametrize("portfolio_size", [1, 50])
+def test_tail_quantile_matches_monte_carlo(portfolio_size):
+    # The 99th percentile of 20,000 heavy-tailed funds is only good to ~10%
+    check = cross_check_monte_carlo(PROB_DIST, LIQUIDATION_PCT, AVERAGE_YOY_GROWTH,
+                                    AVERAGE_EXIT_TIME, portfolio_size, SIMULATION_RUNS,
+                                    quantiles=(0.99,), seed=SEED)
+    assert check["max_relative_error"] < 0.20
+
+
+# (average_yoy_growth, average_exit_time, portfolio_size); alpha is 1.59 for
+# 40% growth and 1.49 for 50%
+HEAVY_TAILS = [(0.40, 5, 1), (0.40, 5, 10), (0.50, 5, 1)]
+SMALL_LIQUIDATION_PCT = 0.05
+
+
+@pytest.mark.parametrize("average_yoy_growth, average_exit_time, portfolio_size", HEAVY_TAILS)
+def test_heavy_tails_match_monte_carlo_on_a_bounded_grid(average_yoy_growth, average_exit_time,
+                                                         portfolio_size):
+    start = time.perf_counter()
+    distribution = fund_return_distribution(PROB_DIST, SMALL_LIQUIDATION_PCT, average_yoy_growth,
+                                            average_exit_time, portfolio_size)
+    assert time.perf_counter() - start < 5.0
+    assert len(distribution.values) <= MAX_GRID_POINTS + 1
+
+    check = cross_check_monte_carlo(PROB_DIST, SMALL_LIQUIDATION_PCT, average_yoy_growth,
+                                    average_exit_time, portfolio_size, SIMULATION_RUNS,
+                                    quantiles=(0.25, 0.50, 0.75, 0.90), seed=SEED)
+    assert check["ks_statistic"] < 0.015
+    assert check["max_relative_error"] < 0.10
+
+
+@pytest.mark.parametrize("average_yoy_growth, average_exit_time", [(0.50, 5), (1.0, 10), (3.0, 100)])
+def test_alpha_close_to_one_is_rejected(average_yoy_growth, average_exit_time):
+    with pytest.raises(ValueError, match="Monte Carlo"):
+        fund_return_distribution(PROB_DIST, LIQUIDATION_PCT, average_yoy_growth,
+                                 average_exit_time, 50)
+
+
+def test_batch_falls_back_to_monte_carlo():
+    scenario = normalize_scenario({"engine": "analytic", "average_yoy_growth": 1.0,
+                                   "average_exit_time": 10, "simulation_runs": 1000, "seed": SEED})
+    with pytest.warns(RuntimeWarning, match="falling back to Monte Carlo"):
+        summary, actual_returns = run_scenario(scenario)
+    assert summary["engine"] == "monte_carlo"
+    assert len(actual_returns) == 1000
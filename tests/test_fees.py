@@ -0,0 +1,77 @@
+"""
+Hand-computed cases for the European fee and carry waterfall (fees.py).
+
+With a 10% hurdle over one year the preferred return is 0.1, and with 20%
+carry and a full catch-up the catch-up tier is 0.2 * 0.1 / (1 - 0.2) = 0.025
+of committed capital wide.
+"""
+
+import numpy as np
+import pytest
+
+from fees import apply_fee_structures, distribute_proceeds, net_fund_multiples
+from library import calculate_actual_fund_returns
+
+CARRY_PCT = 0.2
+HURDLE_RATE = 0.1
+FUND_LIFESPAN = 1
+
+
+def waterfall(proceeds, catch_up_pct=1.0, hurdle_rate=HURDLE_RATE):
+    lp, gp = distribute_proceeds(proceeds, FUND_LIFESPAN, CARRY_PCT, hurdle_rate, catch_up_pct)
+    return float(lp), float(gp)
+
+
+@pytest.mark.parametrize("proceeds", [0.0, 0.6, 1.0, 1.05, 1.1])
+def test_below_the_hurdle_everything_goes_to_the_lps(proceeds):
+    assert waterfall(proceeds) == pytest.approx((proceeds, 0.0))
+
+
+def test_partially_into_a_full_catch_up():
+    # 0.01 past the hurdle, all of it to the GP
+    assert waterfall(1.11) == pytest.approx((1.10, 0.01))
+
+
+def test_full_catch_up_gives_the_gp_its_carry_share():
+    # At the end of the catch-up the GP holds 20% of the 0.125 profit
+    assert waterfall(1.125) == pytest.approx((1.10, 0.025))
+    # Past it, profits are split 80/20
+    assert waterfall(1.5) == pytest.approx((1.40, 0.10))
+
+
+def test_partial_catch_up_pct():
+    # With a 50% catch-up the tier is 0.2 * 0.1 / (0.5 - 0.2) = 1/15 wide
+    assert waterfall(1.13, catch_up_pct=0.5) == pytest.approx((1.115, 0.015))
+    assert waterfall(1.1 + 1 / 15, catch_up_pct=0.5) == pytest.approx((1.1 + 1 / 30, 1 / 30))
+    assert waterfall(2.0, catch_up_pct=0.5) == pytest.approx((1.80, 0.20))
+
+
+def test_catch_up_pct_at_or_below_carry_skips_the_catch_up():
+    # Only the 0.9 above the preferred return is split
+    assert waterfall(2.0, catch_up_pct=CARRY_PCT) == pytest.approx((1.82, 0.18))
+
+
+def test_zero_hurdle_matches_flat_carry():
+    raw_returns = np.array([0.0, 0.5, 1.0, 1.25, 3.0])
+    proceeds = raw_returns * (1.0 - 0.02 * 10)
+    flat_carry = proceeds - CARRY_PCT * np.maximum(proceeds - 1.0, 0.0)
+    for catch_up_pct in (1.0, 0.5):
+        net = net_fund_multiples(raw_returns, 0.02, 10, CARRY_PCT, 0.0, catch_up_pct)
+        np.testing.assert_allclose(net, flat_carry)
+    np.testing.assert_allclose(net, [0.0, 0.4, 0.8, 1.0, 2.12])
+
+
+def test_no_carry_matches_the_management_fee_only_formula():
+    raw_returns = [0.0, 0.7, 2.0, 12.5]
+    actual_returns = calculate_actual_fund_returns(raw_returns, 0.02, 10)
+    assert actual_returns == pytest.approx([x * (1.0 - 0.02 * 10) for x in raw_returns])
+
+
+def test_fee_structures_match_one_at_a_time():
+    raw_returns = np.array([0.5, 1.4, 4.0])
+    structures = [{"mgmt_pct_fee": 0.02, "fund_lifespan": 10},
+                  {"mgmt_pct_fee": 0.025, "fund_lifespan": 8, "carry_pct": 0.3,
+                   "hurdle_rate": 0.08, "catch_up_pct": 0.8}]
+    combined = apply_fee_structures(raw_returns, structures)
+    for column, structure in zip(combined.T, structures):
+        np.testing.assert_allclose(column, net_fund_multiples(raw_returns, **structure))
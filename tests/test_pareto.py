@@ -0,0 +1,39 @@
+"""
+Statistical checks of the native power-law sampler (pareto.py) against its
+analytic CDF and, when untruncated, against the powerlaw package.
+"""
+
+import numpy as np
+import pytest
+
+from library import calculate_alpha
+from pareto import sample_power_law, validate_sampler
+
+DRAWS = 20000
+SEED = 2022
+
+# The 95% KS critical values for 20,000 draws are about 0.0096 (one sample)
+# and 0.0136 (two samples)
+MAX_KS_CDF = 0.015
+MAX_KS_POWERLAW = 0.02
+
+
+@pytest.mark.parametrize("alpha", [calculate_alpha(0.25, 5), 2.5])
+def test_sampler_matches_cdf_and_powerlaw(alpha):
+    # powerlaw draws from NumPy's global random state
+    np.random.seed(SEED)
+    results = validate_sampler(alpha, DRAWS, seed=SEED)
+    assert results["ks_statistic_cdf"] < MAX_KS_CDF
+    assert results["ks_statistic_powerlaw"] < MAX_KS_POWERLAW
+
+
+@pytest.mark.parametrize("x_max", [10.0, 1000.0])
+def test_truncated_sampler_matches_cdf(x_max):
+    alpha = calculate_alpha(0.25, 5)
+    results = validate_sampler(alpha, DRAWS, x_max=x_max, seed=SEED)
+    assert results["ks_statistic_cdf"] < MAX_KS_CDF
+    assert "ks_statistic_powerlaw" not in results
+
+    samples = sample_power_law(DRAWS, alpha, x_max, seed=SEED)
+    assert samples.min() >= 1.0
+    assert samples.max() < x_max